@@ -0,0 +1,171 @@
+import numpy as np
+import math
+import time
+from scipy import signal
+from scipy import ndimage
+
+# Relative per-pixel costs of the three strategies, measured with the
+# benchmark at the bottom of this file (run `python convolve.py`).
+# direct:    ~ DIRECT_COST * kh * kw
+# separable: ~ SEPARABLE_COST * (kh + kw)
+# fft:       ~ FFT_COST * log2(padded size)
+DIRECT_COST = 4.0
+SEPARABLE_COST = 1.0
+FFT_COST = 6.0
+
+# overlap-add only pays off once the image is this many times the kernel
+OVERLAP_ADD_RATIO = 8
+
+METHODS = ('auto', 'direct', 'separable', 'fft')
+
+
+def separate(kernel, tol=1e-10):
+    """
+    Split a 2D kernel into a column and a row vector, if it is separable.
+
+    Output:
+    ----------------
+    (col, row)  1D arrays with np.outer(col, row) == kernel, or None when the
+                kernel has rank greater than one.
+    """
+    kernel = np.asarray(kernel, dtype=np.float64)
+    if kernel.ndim != 2:
+        return None
+    u, s, vt = np.linalg.svd(kernel)
+    if s[0] == 0 or (len(s) > 1 and s[1] > tol * s[0]):
+        return None
+    scale = math.sqrt(s[0])
+    return u[:, 0] * scale, vt[0] * scale
+
+
+def choose_method(image_shape, kernel_shape, separable=False):
+    """
+    Pick the cheapest strategy ('direct', 'separable' or 'fft') for a 'same'
+    convolution of an image of image_shape with a kernel of kernel_shape.
+    """
+    kh, kw = kernel_shape
+    h, w = image_shape[-2:]
+    costs = {
+        'direct': DIRECT_COST * kh * kw,
+        'fft': FFT_COST * math.log((h + kh - 1) * (w + kw - 1), 2),
+    }
+    if separable:
+        costs['separable'] = SEPARABLE_COST * (kh + kw)
+    return min(costs, key=costs.get)
+
+
+def _fftconvolve(array, kernel):
+    # overlap-add when the kernel is much smaller than the image, otherwise
+    # a single padded transform (oaconvolve needs scipy >= 1.4)
+    oaconvolve = getattr(signal, 'oaconvolve', None)
+    if oaconvolve is not None and min(array.shape[0] // kernel.shape[0],
+                                      array.shape[1] // kernel.shape[1]) >= OVERLAP_ADD_RATIO:
+        return oaconvolve(array, kernel, 'same')
+    return signal.fftconvolve(array, kernel, 'same')
+
+
+def sepconvolve2d(array, col, row, method='auto'):
+    """
+    'same' convolution of a 2D array with the separable kernel
+    np.outer(col, row), with zero padding as in signal.convolve2d.
+
+    Inputs:
+    ----------------
+    array       2D array (any numeric dtype, result is float64).
+
+    col, row    1D kernels applied along the rows and columns. Both must
+                have odd length.
+
+    method      'auto', 'direct', 'separable' or 'fft'.
+    """
+    col = np.asarray(col, dtype=np.float64).ravel()
+    row = np.asarray(row, dtype=np.float64).ravel()
+    assert len(col) % 2 == 1 and len(row) % 2 == 1, "Dimension must be odd"
+    assert method in METHODS, "Unknown method %r" % (method,)
+    array = np.asarray(array, dtype=np.float64)
+
+    if method == 'auto':
+        method = choose_method(array.shape, (len(col), len(row)), separable=True)
+    if method == 'separable':
+        out = ndimage.convolve1d(array, col, axis=0, mode='constant', cval=0.0)
+        return ndimage.convolve1d(out, row, axis=1, mode='constant', cval=0.0)
+    kernel = np.outer(col, row)
+    if method == 'fft':
+        return _fftconvolve(array, kernel)
+    return signal.convolve2d(array, kernel, 'same')
+
+
+def convolve2d(array, kernel, method='auto'):
+    """
+    'same' convolution of a 2D array with a 2D kernel, picking the strategy
+    per call. Drop-in replacement for signal.convolve2d(array, kernel, 'same').
+
+    Inputs:
+    ----------------
+    array       2D array (any numeric dtype, result is float64).
+
+    kernel      2D kernel. Separable odd-sized kernels are detected and run
+                as two 1D passes when that is cheapest.
+
+    method      'auto', 'direct', 'separable' or 'fft'.
+    """
+    assert method in METHODS, "Unknown method %r" % (method,)
+    array = np.asarray(array, dtype=np.float64)
+    kernel = np.asarray(kernel, dtype=np.float64)
+
+    factors = None
+    if method in ('auto', 'separable') and kernel.shape[0] % 2 == 1 and kernel.shape[1] % 2 == 1:
+        factors = separate(kernel)
+    assert method != 'separable' or factors is not None, "Kernel is not separable"
+
+    if method == 'auto':
+        method = choose_method(array.shape, kernel.shape, separable=factors is not None)
+    if method == 'separable':
+        return sepconvolve2d(array, factors[0], factors[1], 'separable')
+    if method == 'fft':
+        return _fftconvolve(array, kernel)
+    return signal.convolve2d(array, kernel, 'same')
+
+
+def _time(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.time()
+        fn()
+        best = min(best, time.time() - start)
+    return best
+
+
+def benchmark(sizes=(64, 256, 1024), ksizes=(3, 5, 9, 19, 31, 61), repeat=3):
+    """
+    Time every strategy on random images, once with separable (Gaussian) and
+    once with dense random kernels, and print the fastest strategy next to
+    the one choose_method picks. The crossover points are where the fastest
+    column changes.
+    """
+    for separable in (True, False):
+        print("%s kernels" % ('separable' if separable else 'dense'))
+        print("%6s %6s %10s %10s %10s %10s  %s" % ('image', 'kernel', 'direct', 'separable', 'fft', 'auto', 'fastest/picked'))
+        for size in sizes:
+            array = np.random.rand(size, size)
+            for k in ksizes:
+                x = np.arange(k) - k // 2
+                g = np.exp(-x ** 2 / (2 * (k / 6.0) ** 2))
+                kernel = np.outer(g, g) if separable else np.random.rand(k, k)
+                times = {}
+                for method in METHODS:
+                    if method == 'separable' and not separable:
+                        times[method] = float('inf')
+                    elif method == 'direct' and size * size * k * k > 256 * 256 * 61 * 61:
+                        times[method] = float('inf') # far too slow to bother
+                    else:
+                        times[method] = _time(lambda: convolve2d(array, kernel, method), repeat)
+                fastest = min(('direct', 'separable', 'fft'), key=times.get)
+                picked = choose_method(array.shape, (k, k), separable)
+                print("%6d %6d %10.5f %10.5f %10.5f %10.5f  %s/%s" % (
+                    size, k, times['direct'], times['separable'], times['fft'], times['auto'], fastest, picked))
+        print("")
+
+
+if __name__ == '__main__':
+    benchmark()
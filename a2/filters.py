@@ -0,0 +1,164 @@
+import numpy as np
+import threading
+from collections import OrderedDict
+from scipy import signal
+from scipy import ndimage
+import convolve
+
+# spatial (row, column) axes for each supported array layout
+LAYOUTS = {
+    'hw': (0, 1),     # a single grayscale image
+    'nhw': (1, 2),    # a stack of grayscale images
+    'hwc': (0, 1),    # a single multi-channel image
+    'nhwc': (1, 2),   # a stack of multi-channel images
+}
+
+# number of kernels kept by the shared kernel cache
+KERNEL_CACHE_SIZE = 64
+
+def _build_box(n):
+    assert n%2 != 0, "Dimension must be odd"
+    return np.full((n,n),1.0/(n*n), dtype = float)
+
+def _build_gauss1d(sigma):
+    # generate n, ensure n is odd
+    n = np.ceil(6*sigma)
+    n = n+1 if n%2 == 0 else n
+
+    i = np.arange(-np.floor(n/2),np.floor(n/2)+1,1) # generate the range
+    i = np.exp((-i**2)/(2.0*sigma**2)) # apply the map to the whole range at once
+    return i/np.sum(i) # return normalized
+
+def _build_gauss2d(sigma):
+    i = kernel(sigma, 'gauss1d') # reuse the cached 1d guass
+    return np.outer(i, i) # same as convolving i with i'
+
+KERNEL_BUILDERS = {
+    'box': _build_box,
+    'gauss1d': _build_gauss1d,
+    'gauss2d': _build_gauss2d,
+}
+
+class KernelCache(object):
+    """
+    Bounded LRU cache of filter kernels keyed by (size, kind, dtype).
+
+    Kernels are returned read-only, so they can be shared between callers;
+    copy one before modifying it.
+    """
+
+    def __init__(self, maxsize=KERNEL_CACHE_SIZE):
+        assert maxsize > 0, "Cache size must be positive"
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._kernels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, size, kind='gauss1d', dtype=np.float64):
+        assert kind in KERNEL_BUILDERS, "Unknown kernel kind %r" % (kind,)
+        key = (float(size), kind, np.dtype(dtype))
+        with self._lock:
+            k = self._kernels.pop(key, None)
+            if k is not None:
+                self._kernels[key] = k # mark as most recently used
+                self.hits += 1
+                return k
+        # build outside the lock, gauss2d asks the cache for its 1d factor
+        k = np.array(KERNEL_BUILDERS[kind](size), dtype=dtype)
+        k.flags.writeable = False
+        with self._lock:
+            self.misses += 1
+            self._kernels[key] = k
+            while len(self._kernels) > self.maxsize:
+                self._kernels.popitem(last=False) # evict least recently used
+        return k
+
+    def clear(self):
+        with self._lock:
+            self._kernels.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._kernels)
+
+_kernel_cache = KernelCache()
+
+def kernel(size, kind='gauss1d', dtype=np.float64):
+    # sigma for the gaussians, n for the boxfilter
+    return _kernel_cache.get(size, kind, dtype)
+
+def boxfilter(n):
+    return kernel(n, 'box')
+
+def gauss1d(sigma=1):
+    return kernel(sigma, 'gauss1d')
+
+def gauss2d(sigma=1):
+    return kernel(sigma, 'gauss2d')
+
+def gaussconvolve2d(array,sigma):
+    f = gauss1d(sigma) # the 2d gaussian is separable, so keep the 1d filter
+    array = convolve.sepconvolve2d(array,f,f) # convolve with 2d filter of same size, engine picks the strategy
+    return array
+
+def filter_stack(stack, col, row=None, layout='nhw', method='auto'):
+    """
+    'same' convolution of every image and channel in a stack with the
+    separable kernel np.outer(col, row), in one vectorized call.
+
+    Inputs:
+    ----------------
+    stack       Array laid out as described by layout, e.g. N x H x W for a
+                stack of grayscale images or H x W x C for one colour image.
+                Any numeric dtype, the result is float64.
+
+    col, row    Odd-length 1D kernels applied along the image rows and
+                columns. row defaults to col.
+
+    layout      One of 'hw', 'nhw', 'hwc', 'nhwc'.
+
+    method      'auto', 'separable' or 'fft'. 'auto' asks
+                convolve.choose_method once for the whole stack.
+
+    Output:
+    ----------------
+    out         Filtered float64 array with the same shape as stack. Each
+                image matches convolve.sepconvolve2d on that image alone.
+    """
+    assert layout in LAYOUTS, "Unknown layout %r" % (layout,)
+    assert method in ('auto', 'separable', 'fft'), "Unknown method %r" % (method,)
+    col = np.asarray(col, dtype=np.float64).ravel()
+    row = col if row is None else np.asarray(row, dtype=np.float64).ravel()
+    assert len(col) % 2 == 1 and len(row) % 2 == 1, "Dimension must be odd"
+    stack = np.asarray(stack, dtype=np.float64)
+    assert stack.ndim == len(layout), "Expected a %s array, got %d dimensions" % (layout.upper(), stack.ndim)
+
+    axes = LAYOUTS[layout]
+    shape = (stack.shape[axes[0]], stack.shape[axes[1]])
+    if method == 'auto':
+        # direct never beats two 1D passes for a separable kernel
+        method = convolve.choose_method(shape, (len(col), len(row)), separable=True)
+        method = 'fft' if method == 'fft' else 'separable'
+
+    if method == 'fft':
+        # broadcast the 2D kernel over the stack and channel axes
+        kshape = [1] * stack.ndim
+        kshape[axes[0]] = len(col)
+        kshape[axes[1]] = len(row)
+        kernel = np.outer(col, row).reshape(kshape)
+        return signal.fftconvolve(stack, kernel, 'same', axes=axes)
+
+    out = ndimage.convolve1d(stack, col, axis=axes[0], mode='constant', cval=0.0)
+    return ndimage.convolve1d(out, row, axis=axes[1], mode='constant', cval=0.0)
+
+def gaussconvolve_stack(stack, sigma, layout='nhw', method='auto'):
+    # one gaussian, built once, for every image and channel in the stack
+    f = gauss1d(sigma)
+    return filter_stack(stack, f, f, layout, method)
+
+def boxconvolve_stack(stack, n, layout='nhw', method='auto'):
+    # the n x n boxfilter is the outer product of two 1d boxes of 1/n
+    f = boxfilter(n)[0] * n
+    return filter_stack(stack, f, f, layout, method)
@@ -0,0 +1,107 @@
+import multiprocessing
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+import ncc
+import detect
+import pyramids
+
+# number of decoded images a worker keeps
+IMAGE_CACHE_SIZE = 2
+
+# per-process state, set up once per worker by _init_worker
+_templates = None
+_images = OrderedDict() # path -> decoded image, most recently used last
+
+
+def _init_worker(templates):
+    global _templates
+    _templates = templates
+    _images.clear()
+
+
+def _open(path):
+    # the units of one image are queued together, so a worker usually gets
+    # several levels of the image it decoded last
+    if path in _images:
+        im = _images.pop(path)
+    else:
+        im = Image.open(path).convert('L')
+    _images[path] = im
+    while len(_images) > IMAGE_CACHE_SIZE:
+        _images.popitem(last=False)
+    return im
+
+
+def _detect_unit(unit):
+    # one (image, level) work unit: resize, correlate against the whole
+    # template bank and return the (not yet suppressed) peaks per template
+    index, path, level, size, threshold, reduction = unit
+    corrs = ncc.normxcorr2D_multi(_open(path).resize(size, Image.BICUBIC), _templates)
+    dets = [detect.level_detections(corrs[t], level, reduction, threshold) for t in range(len(_templates))]
+    return index, level, dets
+
+
+def _units(image_paths, threshold, minsize, reduction):
+    units = []
+    for index, path in enumerate(image_paths):
+        size = Image.open(path).size # only reads the header
+        for level, level_size in enumerate(pyramids.level_sizes(size, minsize, reduction)):
+            units.append((size[0] * size[1], index, path, level, level_size, threshold, reduction))
+    # biggest images first so the pool does not end on a long tail, and the
+    # levels of each image together so workers can reuse the decoded image
+    units.sort(key=lambda u: (-u[0], u[1], u[3]))
+    return [unit[1:] for unit in units]
+
+
+def detect_batch(image_paths, templates, threshold, minsize=15, reduction=0.8, overlap=0.3, workers=None, chunksize=1):
+    """
+    Detect a bank of templates in many images, spreading the (image, pyramid
+    level) work units over a process pool.
+
+    Inputs:
+    ----------------
+    image_paths     Image files to search.
+
+    templates       List of PIL templates.
+
+    threshold       Minimum correlation of a detection.
+
+    minsize         Smallest pyramid level (as in makePyramid).
+
+    reduction       Scale factor between successive pyramid levels.
+
+    overlap         Non-maximum suppression overlap (see detect.detect).
+
+    workers         Number of worker processes, None for one per core. With
+                    workers=1 everything runs in this process.
+
+    Output:
+    ----------------
+    detections      One entry per image, in the order of image_paths, each a
+                    list with one N x 4 (x, y, scale, score) array per
+                    template. The result does not depend on workers or on
+                    the order in which units finish.
+    """
+    units = _units(image_paths, threshold, minsize, reduction)
+
+    if workers == 1:
+        _init_worker(templates)
+        results = [_detect_unit(unit) for unit in units]
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, (templates,))
+        try:
+            results = list(pool.imap_unordered(_detect_unit, units, chunksize))
+        finally:
+            pool.close()
+            pool.join()
+
+    # merge per image in (image, level) order, whatever order units finished in
+    results.sort(key=lambda r: (r[0], r[1]))
+    sizes = [template.size for template in templates]
+    found = [[[] for _ in templates] for _ in image_paths]
+    for index, level, dets in results:
+        for t in range(len(templates)):
+            found[index][t].append(dets[t])
+    return [[detect.non_max_suppression(np.concatenate(d) if d else np.empty((0, 4)), s, overlap)
+             for d, s in zip(per_image, sizes)] for per_image in found]
@@ -0,0 +1,126 @@
+import numpy as np
+from PIL import ImageDraw
+from scipy import ndimage
+
+# columns of a detection array
+X, Y, SCALE, SCORE = range(4)
+
+
+def find_peaks(corr, threshold, size=3):
+    """
+    Local maxima of a correlation array above threshold.
+
+    Inputs:
+    ----------------
+    corr        2D array of correlation coefficients.
+
+    threshold   Minimum score of a peak.
+
+    size        Side of the neighbourhood a peak must be the maximum of.
+
+    Output:
+    ----------------
+    rows, cols  Coordinates of the peaks.
+
+    scores      corr at the peaks.
+    """
+    corr = np.asarray(corr)
+    peaks = (corr > threshold) & (corr == ndimage.maximum_filter(corr, size=size, mode='constant', cval=-np.inf))
+    rows, cols = np.nonzero(peaks)
+    return rows, cols, corr[rows, cols]
+
+
+def level_detections(corr, level, reduction, threshold, size=3):
+    """
+    Peaks of the correlation array of one pyramid level as an N x 4 array of
+    (x, y, scale, score), with the template centre (x, y) in the coordinates
+    of the original image and scale = 1/reduction**level.
+    """
+    rows, cols, scores = find_peaks(corr, threshold, size)
+    scale = 1.0 / (reduction ** level)
+    dets = np.empty((len(scores), 4))
+    dets[:, X] = scale * cols
+    dets[:, Y] = scale * rows
+    dets[:, SCALE] = scale
+    dets[:, SCORE] = scores
+    return dets
+
+
+def boxes(dets, template_size):
+    # (left, top, right, bottom) of each detection in the original image
+    w = dets[:, SCALE] * template_size[0]
+    h = dets[:, SCALE] * template_size[1]
+    left = dets[:, X] - w / 2
+    top = dets[:, Y] - h / 2
+    return np.column_stack((left, top, left + w, top + h))
+
+
+def non_max_suppression(dets, template_size, overlap=0.3):
+    """
+    Greedy non-maximum suppression across all pyramid levels: keep the best
+    scoring detection, drop every other detection whose box (the template
+    at that detection's scale) overlaps it by more than overlap
+    (intersection over union), and repeat.
+
+    Output:
+    ----------------
+    dets        The kept detections, best first.
+    """
+    if len(dets) == 0:
+        return dets
+    dets = dets[np.argsort(-dets[:, SCORE], kind='mergesort')]
+    b = boxes(dets, template_size)
+    area = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+
+    keep = []
+    order = np.arange(len(dets))
+    while len(order) > 0:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        iw = np.maximum(0, np.minimum(b[i, 2], b[rest, 2]) - np.maximum(b[i, 0], b[rest, 0]))
+        ih = np.maximum(0, np.minimum(b[i, 3], b[rest, 3]) - np.maximum(b[i, 1], b[rest, 1]))
+        inter = iw * ih
+        iou = inter / (area[i] + area[rest] - inter)
+        order = rest[iou <= overlap]
+    return dets[keep]
+
+
+def detect(responses, template_sizes, threshold, reduction, overlap=0.3, size=3):
+    """
+    Detections of a bank of templates over a whole pyramid.
+
+    Inputs:
+    ----------------
+    responses       Iterable with one T x rows x cols response stack per
+                    pyramid level, finest level first (e.g. main.matchTemplates).
+
+    template_sizes  (width, height) of each of the T templates.
+
+    threshold       Minimum correlation of a detection.
+
+    reduction       Scale factor between successive pyramid levels.
+
+    overlap         Intersection over union above which non-maximum
+                    suppression drops the weaker of two detections.
+
+    Output:
+    ----------------
+    dets            List with one N x 4 array of (x, y, scale, score) per
+                    template, best first.
+    """
+    found = [[] for _ in template_sizes]
+    for level, corrs in enumerate(responses):
+        for t in range(len(template_sizes)):
+            found[t].append(level_detections(corrs[t], level, reduction, threshold, size))
+    return [non_max_suppression(np.concatenate(d) if d else np.empty((0, 4)), s, overlap)
+            for d, s in zip(found, template_sizes)]
+
+
+def draw_detections(image, dets, template_size, fill="red", width=2):
+    # draw a box around every detection on a PIL image (in place)
+    draw = ImageDraw.Draw(image)
+    for left, top, right, bottom in boxes(dets, template_size):
+        draw.rectangle((left, top, right, bottom), outline=fill, width=width)
+    del draw
+    return image
@@ -1,27 +1,26 @@
-from PIL import Image, ImageDraw
+from PIL import Image
 import numpy as np
 import math
 from scipy import signal
 import ncc
+import detect
+import pyramids
+import batch
 
 # define constants
 pyramid_reduction = 0.80
 pyramid_min_size = 15
 template_width = 20
 match_threshold = 0.54
+nms_overlap = 0.3
+workers = None # worker processes for the batch runner, None for one per core
 image_locs = ['family.jpg','fans.jpg','judybats.jpg','sports.jpg','students.jpg','tree.jpg']
 template_loc = 'faces\\template.jpg'
 
 # define functions
 def makePyramid(image, minsize):
-	[x,y] = image.size
-	res = []
-	while (x > minsize and y > minsize): # resize and append new image
-		image_next = image.resize((x,y), Image.BICUBIC)
-		x = int(x*pyramid_reduction)
-		y = int(y*pyramid_reduction)
-		res.append(image_next)
-	return res
+	# all levels at once, see pyramids.iter_pyramid for the lazy version
+	return list(pyramids.iter_pyramid(image, minsize, pyramid_reduction))
 
 def showPyramid(pyramid):
 	[x,y] = pyramid[0].size
@@ -45,44 +44,41 @@ def resize(template, width=15):
 	return template
 
 def findTemplate(pyramid, template, threshold):
-	[a,b] = template.size
+	return findTemplates(pyramid, [template], threshold)
 
-	marked = pyramid[0].convert('RGB') # the marked image to return
-	draw = ImageDraw.Draw(marked) 
+def matchTemplates(pyramid, templates):
+	# yield one T x rows x cols response stack per pyramid level, each level
+	# is transformed once and correlated against the whole template bank
+	for level in pyramid:
+		yield ncc.normxcorr2D_multi(level, templates)
 
-	for i in range(len(pyramid)): # for every image
-		[x,y] = pyramid[i].size
-		corr = ncc.normxcorr2D(pyramid[i],template)	# generate corr array
+def detectTemplates(pyramid, templates, threshold):
+	# one (x, y, scale, score) array per template, local maxima only and
+	# non-maximum suppressed across all pyramid levels
+	sizes = [template.size for template in templates]
+	return detect.detect(matchTemplates(pyramid, templates), sizes, threshold, pyramid_reduction, nms_overlap)
 
-		for j in range(len(corr)): # iterate to find positions 
-			for k in range(len(corr[j])):
-				if(corr[j][k] > threshold):	# we've found a match
-					ratio = 1/(pyramid_reduction**i)
-					a_offset = ratio*a; # calculate offset 
-					b_offset = ratio*b;
-					p = ratio*k -a_offset/2 # find top left corner
-					q = ratio*j -b_offset/2
-					
-					ratio = 1/(pyramid_reduction**i) # calculate ratios and offsets
-					a_offset = ratio*a; 
-					b_offset = ratio*b;
-					p = ratio*k -a_offset/2 # find the center
-					q = ratio*j -b_offset/2
-					draw.line((p,q,p+a_offset,q),fill="red",width=2) #draw a box
-					draw.line((p,q,p,q+b_offset),fill="red",width=2)
-					draw.line((p+a_offset,q,p+a_offset,q+b_offset),fill="red",width=2)
-					draw.line((p,q+b_offset,p+a_offset,q+b_offset),fill="red",width=2)
-	del draw
+def findTemplates(pyramid, templates, threshold):
+	return markDetections(pyramid[0], templates, detectTemplates(pyramid, templates, threshold))
+
+def markDetections(image, templates, detections):
+	marked = image.convert('RGB') # the marked image to return
+	for template, dets in zip(templates, detections):
+		detect.draw_detections(marked, dets, template.size) # draw a box per detection
 	return marked
 
 # Run our scripts
-template = Image.open(template_loc)
-template = resize(template, template_width) # resize template
+if __name__ == '__main__': # worker processes import this module too
+	template = Image.open(template_loc)
+	template = resize(template, template_width) # resize template
+
+	# every (image, pyramid level) is a work unit for the process pool
+	paths = ["faces\\"+loc for loc in image_locs]
+	detections = batch.detect_batch(paths, [template], match_threshold, pyramid_min_size, pyramid_reduction, nms_overlap, workers)
 
-for i in range(len(image_locs)):
-	im = Image.open("faces\\"+image_locs[i])
-	pyramid = makePyramid(im, pyramid_min_size) #create pyramid
-	#showPyramid(pyramid)
+	for i in range(len(image_locs)):
+		im = Image.open(paths[i])
+		#showPyramid(makePyramid(im, pyramid_min_size))
 
-	marked = findTemplate(pyramid,template, match_threshold)
-	marked.save("output\\"+image_locs[i], "JPEG")
\ No newline at end of file
+		marked = markDetections(im, [template], detections[i])
+		marked.save("output\\"+image_locs[i], "JPEG")
\ No newline at end of file
@@ -0,0 +1,98 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+
+# number of pyramid levels kept by a PyramidCache by default
+PYRAMID_CACHE_SIZE = 64
+
+
+def level_sizes(size, minsize, reduction):
+    # (width, height) of every level, the same sequence makePyramid produces
+    [x, y] = size
+    while x > minsize and y > minsize:
+        yield (x, y)
+        x = int(x * reduction)
+        y = int(y * reduction)
+
+
+def image_hash(image):
+    # content hash of a PIL image, used as the cache key
+    h = hashlib.sha1()
+    h.update(("%s %d %d " % ((image.mode,) + image.size)).encode('ascii'))
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+class PyramidCache(object):
+    """
+    Bounded LRU cache of pyramid levels keyed by (image hash, level
+    parameters, level index). Levels are PIL images, treat them as
+    read-only.
+    """
+
+    def __init__(self, maxsize=PYRAMID_CACHE_SIZE):
+        assert maxsize > 0, "Cache size must be positive"
+        self.maxsize = maxsize
+        self._levels = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            level = self._levels.pop(key, None)
+            if level is not None:
+                self._levels[key] = level # mark as most recently used
+            return level
+
+    def put(self, key, level):
+        with self._lock:
+            self._levels.pop(key, None)
+            self._levels[key] = level
+            while len(self._levels) > self.maxsize:
+                self._levels.popitem(last=False) # evict least recently used
+
+    def clear(self):
+        with self._lock:
+            self._levels.clear()
+
+    def __len__(self):
+        return len(self._levels)
+
+
+def iter_pyramid(image, minsize, reduction=0.8, cascade=False, cache=None, resample=Image.BICUBIC):
+    """
+    Lazily yield the levels of an image pyramid, finest first. Only the
+    level being yielded (and, when cascading, the one it was made from) is
+    alive at a time, so memory stays constant in the number of levels and a
+    consumer that stops iterating never pays for the coarser levels.
+
+    Inputs:
+    ----------------
+    image       The PIL image.
+
+    minsize     Levels stop once either side is no longer above minsize.
+
+    reduction   Scale factor between successive levels.
+
+    cascade     Resize each level from the previous one instead of from the
+                original. Cheaper for big images, slightly softer levels.
+
+    cache       Optional PyramidCache. Levels are looked up by the hash of
+                image before anything is resized.
+
+    resample    PIL resampling filter.
+    """
+    key = None
+    if cache is not None:
+        key = (image_hash(image), minsize, reduction, cascade, resample)
+
+    previous = image
+    for i, size in enumerate(level_sizes(image.size, minsize, reduction)):
+        level = cache.get(key + (i,)) if cache is not None else None
+        if level is None:
+            source = previous if cascade else image
+            level = source.resize(size, resample)
+            if cache is not None:
+                cache.put(key + (i,), level)
+        previous = level
+        yield level
@@ -1,43 +1,32 @@
+from __future__ import print_function
 from PIL import Image, ImageDraw
 import numpy as np
-import random
 import os.path
-import pickle
+import ssd
+import fillfront
+import inpaint
+import multiscale
+
+try:
+	input = raw_input # Python 2
+except NameError:
+	pass
 
 ##############################################################################
 #                        Functions for you to complete                       #
 ##############################################################################
 def ComputeSSD(TODOPatch, TODOMask, textureIm, patchL):
-	patch_rows, patch_cols, patch_bands = np.shape(TODOPatch)
-	tex_rows, tex_cols, tex_bands = np.shape(textureIm)
-	ssd_rows = tex_rows - 2 * patchL
-	ssd_cols = tex_cols - 2 * patchL
-	SSD = np.zeros((ssd_rows,ssd_cols))
-               
-	for r in range(ssd_rows):
-		for c in range(ssd_cols):
-			# Compute sum square difference between textureIm and TODOPatch
-			# for all pixels where TODOMask = 0, and store the result in SSD
-			# ignore empty pixels that have a value of 1 in the given mask image
-			temp = 0;
-			for y in range(patch_rows):  # iterate around the patch per pixel of SSD
-				for x in range(patch_cols):
-					if(TODOMask[y][x]==0): # check only valid areas
-						temp += np.sum((textureIm[r+y][c+x]*1.0 - TODOPatch[y][x]*1.0)**2) # store SSD per pixel in temp
-			SSD[r][c] = temp; # set SSD[r][c]
-	return SSD
+	# Masked SSD of TODOPatch against every patch of textureIm, expanded as
+	# ||T||^2 - 2<T,P> + ||P||^2 under the mask and computed with FFTs (see
+	# ssd.py, which also keeps the original loop version to check against).
+	# matching.ExactMatcher builds one ssd.MaskedSSD and reuses it instead.
+	return ssd.masked_ssd(TODOPatch, TODOMask, textureIm, patchL)
 
 def CopyPatch(imHole,TODOMask,textureIm,iPatchCenter,jPatchCenter,iMatchCenter,jMatchCenter,patchL):
-	patchSize = 2 * patchL + 1
-	for i in range(patchSize):
-		for j in range(patchSize):
-			# Copy the selected patch selectPatch into the image containing
-			# the hole imHole for each pixel where TODOMask = 1.
-			# The patch is centred on iPatchCenter, jPatchCenter in the image imHole
-			if TODOMask[i][j] == 1:
-				imHole[iPatchCenter+i-patchL][jPatchCenter+j-patchL] = textureIm[iMatchCenter+i-patchL][jMatchCenter+j-patchL] # from texture to hole
-                TODOMask[i][j] = 0 # Existing pixel values should not be overwritten
-	return imHole
+	# Copy the selected patch selectPatch into the image containing
+	# the hole imHole for each pixel where TODOMask = 1 (see inpaint.py,
+	# which also holds the fill loop itself)
+	return inpaint.copy_patch(imHole,TODOMask,textureIm,iPatchCenter,jPatchCenter,iMatchCenter,jMatchCenter,patchL)
 
 ##############################################################################
 #                            Some helper functions                           #
@@ -53,17 +42,9 @@ def DrawBox(im,x1,y1,x2,y2):
 	return im
 
 def Find_Edge(hole_mask):
-	[cols, rows] = np.shape(hole_mask)
-	edge_mask = np.zeros(np.shape(hole_mask))
-	for y in range(rows):
-		for x in range(cols):
-			if (hole_mask[x,y] == 1):
-				if (hole_mask[x-1,y] == 0 or
-						hole_mask[x+1,y] == 0 or
-						hole_mask[x,y-1] == 0 or
-						hole_mask[x,y+1] == 0):
-					edge_mask[x,y] = 1
-	return edge_mask
+	# vectorized, see fillfront.py. inpaint.fill keeps the edge up to date
+	# with a fillfront.FillFront instead of calling this every iteration
+	return fillfront.find_edge(hole_mask)
 
 ##############################################################################
 #                           Main script starts here                          #
@@ -81,6 +62,20 @@ image_loc = 'camel.jpg'
 # Standard deviation for random patch selection
 randomPatchSD = 30
 
+# Order in which fill front pixels are filled: 'random' (uniform) or
+# 'priority' (Criminisi-style confidence x data term, see scheduler.py)
+fillOrder = 'random'
+
+# Patch search: 'exact' (masked SSD against every texture patch),
+# 'patchmatch' (approximate randomized search) or 'index' (PCA + KD-tree
+# index of the texture patches), see matching.py
+matchBackend = 'exact'
+
+# Coarse-to-fine filling: number of pyramid levels (1 fills at full
+# resolution only) and the search radius around the upsampled coarse match
+multiscaleLevels = 1
+searchRadius = 2
+
 # Display results interactively
 showResults = False
 
@@ -96,16 +91,12 @@ imRows, imCols, imBands = np.shape(im_array)
 # Define hole and texture regions.  This will use files fill_region.pkl and
 #   texture_region.pkl, if both exist, otherwise user has to select the regions.
 if os.path.isfile('fill_region.pkl') and os.path.isfile('texture_region.pkl'):
-	fill_region_file = open('fill_region.pkl', 'rb')
-	fillRegion = pickle.load( fill_region_file )
-	fill_region_file.close()
-
-	texture_region_file = open('texture_region.pkl', 'rb')
-	textureRegion = pickle.load( texture_region_file )
-	texture_region_file.close()
+	# the pickles are written by Python 2, load_region reads them in either
+	fillRegion = inpaint.load_region('fill_region.pkl')
+	textureRegion = inpaint.load_region('texture_region.pkl')
 else:
 	# ask the user to define the regions
-	print "Specify the fill and texture regions using polyselect.py"
+	print("Specify the fill and texture regions using polyselect.py")
 	exit()
 
 #
@@ -150,10 +141,10 @@ if showResults == True:
 	im1 = Image.fromarray(imHole).convert('RGB')
 	im1 = DrawBox(im1,jTextureMin,iTextureMin,jTextureMax,iTextureMax)
 	im1.show()
-	print "Are you happy with this choice of fillRegion and textureIm?"
+	print("Are you happy with this choice of fillRegion and textureIm?")
 	Yes_or_No = False
 	while not Yes_or_No:
-		answer = raw_input("Yes or No: ")
+		answer = input("Yes or No: ")
 		if answer == "Yes" or answer == "No":
 			Yes_or_No = True
 	assert answer == "Yes", "You must be happy. Please try again."
@@ -162,56 +153,13 @@ if showResults == True:
 # Perform the hole filling
 #
 
-while (nFill > 0):
-	print "Number of pixels remaining = " , nFill
-
-	# Set TODORegion to pixels on the boundary of the current fillRegion
-	TODORegion = Find_Edge(fillRegion)
-	edge_pixels = TODORegion.nonzero()
-	nTODO = len(edge_pixels[0])
-
-	while(nTODO > 0):
-
-		# Pick a random pixel from the TODORegion
-		index = np.random.randint(0,nTODO)
-		iPatchCenter = edge_pixels[0][index]
-		jPatchCenter = edge_pixels[1][index]
-
-		# Define the coordinates for the TODOPatch
-		TODOPatch = imHole[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1,:]
-		TODOMask = fillRegion[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1]
-
-		#
-		# Compute masked SSD of TODOPatch and textureIm
-		#
-		ssdIm = ComputeSSD(TODOPatch, TODOMask, textureIm, patchL)
-
-		# Randomized selection of one of the best texture patches
-		ssdIm1 = np.sort(np.copy(ssdIm),axis=None)
-		ssdValue = ssdIm1[int(min(round(abs(random.gauss(0,randomPatchSD))),np.size(ssdIm1)-1))]
-		ssdIndex = np.nonzero(ssdIm==ssdValue)
-		iSelectCenter = ssdIndex[0][0]
-		jSelectCenter = ssdIndex[1][0]
-
-		# adjust i, j coordinates relative to textureIm
-		iSelectCenter = iSelectCenter + patchL
-		jSelectCenter = jSelectCenter + patchL
-		selectPatch = textureIm[iSelectCenter-patchL:iSelectCenter+patchL+1,jSelectCenter-patchL:jSelectCenter+patchL+1,:]
-
-		#
-		# Copy patch into hole
-		#
-		imHole = CopyPatch(imHole,TODOMask,textureIm,iPatchCenter,jPatchCenter,iSelectCenter,jSelectCenter,patchL)
-
-		# Update TODORegion and fillRegion by removing locations that overlapped the patch
-		TODORegion[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1] = 0
-		fillRegion[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1] = 0
-
-		edge_pixels = TODORegion.nonzero()
-		nTODO = len(edge_pixels[0])
-
-	fill_indices = fillRegion.nonzero()
-	nFill = len(fill_indices[0])
+if multiscaleLevels > 1:
+	imHole, timings = multiscale.fill_multiscale(im_array, fillRegion, textureRegion, patchL, multiscaleLevels,
+		randomPatchSD, fillOrder, matchBackend, searchRadius, verbose=True)
+else:
+	imHole, source, stats = inpaint.fill(imHole, fillRegion, textureIm, (iTextureMin, jTextureMin), patchL,
+		randomPatchSD, fillOrder, matchBackend, verbose=True)
+	print("Matching (%s):" % matchBackend, stats)
 
 #
 # Output results
@@ -0,0 +1,131 @@
+"""
+Headless batch hole filling.
+
+    python fillbatch.py manifest.csv --out results --workers 8
+
+Every line of the manifest is one job: image, fill mask, texture mask and
+optionally the output file name, separated by commas (lines starting with
+# are skipped). Relative paths are relative to the manifest. Masks can be
+polyselect.py pickles (.pkl), NumPy arrays (.npy) or images such as .png
+(nonzero = in the region). Jobs run on a process pool; each result is
+written to the output directory, and a timings.csv there records the
+status, time and match quality of every job.
+"""
+import argparse
+import csv
+import multiprocessing
+import os
+import random
+import time
+import traceback
+import numpy as np
+from PIL import Image
+import inpaint
+import matching
+import scheduler
+
+TIMINGS_FIELDS = ('job', 'image', 'output', 'status', 'seconds', 'patches', 'mean_ssd', 'mean_pixel_ssd')
+
+
+def read_manifest(path):
+    # list of (image, fill mask, texture mask, output name) jobs
+    base = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    with open(path) as f:
+        for row in csv.reader(f):
+            row = [field.strip() for field in row]
+            if not row or not row[0] or row[0].startswith('#'):
+                continue
+            assert len(row) in (3, 4), "Manifest line needs image, fill mask, texture mask[, output]: %r" % (row,)
+            image, fillMask, textureMask = [os.path.join(base, p) for p in row[:3]]
+            output = row[3] if len(row) == 4 else os.path.splitext(os.path.basename(image))[0] + '_filled.png'
+            jobs.append((image, fillMask, textureMask, output))
+    return jobs
+
+
+def run_job(job):
+    """
+    Fill one (index, image, fill mask, texture mask, output path, options)
+    job and return its row for timings.csv. Failures are reported in the
+    row instead of stopping the batch.
+    """
+    index, image, fillMask, textureMask, output, options = job
+    row = dict(job=index, image=image, output=output)
+    start = time.time()
+    try:
+        # every job gets its own seed, so results do not depend on the pool
+        random.seed(options['seed'] + index)
+        np.random.seed((options['seed'] + index) % (2 ** 32))
+        im_array = np.asarray(Image.open(image).convert('RGB'), dtype=np.uint8)
+        result, stats = inpaint.fill_image(im_array, inpaint.load_region(fillMask), inpaint.load_region(textureMask),
+                                           options['patchL'], options['randomPatchSD'], options['fillOrder'],
+                                           options['matchBackend'], options['levels'], options['searchRadius'])
+        Image.fromarray(result).convert('RGB').save(output)
+        row.update(status='ok', patches=stats.count, mean_ssd='%.1f' % stats.mean_ssd(),
+                   mean_pixel_ssd='%.3f' % stats.mean_pixel_ssd())
+    except Exception as e:
+        row.update(status='error: %s' % (traceback.format_exception_only(type(e), e)[-1].strip(),))
+    row['seconds'] = '%.3f' % (time.time() - start)
+    return row
+
+
+def run_batch(jobs, outDir, workers=None, **options):
+    """
+    Run (image, fill mask, texture mask, output name) jobs on a pool of
+    workers (None for one per core, 1 to run in this process), writing the
+    results and timings.csv to outDir. Returns the timing rows in job order.
+    """
+    if not os.path.isdir(outDir):
+        os.makedirs(outDir)
+    tasks = [(k, image, fillMask, textureMask, os.path.join(outDir, output), options)
+             for k, (image, fillMask, textureMask, output) in enumerate(jobs)]
+
+    timingsFile = open(os.path.join(outDir, 'timings.csv'), 'w')
+    writer = csv.DictWriter(timingsFile, TIMINGS_FIELDS)
+    writer.writeheader()
+    rows = []
+    try:
+        if workers == 1:
+            results = (run_job(task) for task in tasks)
+            pool = None
+        else:
+            pool = multiprocessing.Pool(workers)
+            results = pool.imap_unordered(run_job, tasks)
+        for row in results:
+            # written as jobs finish, so an interrupted batch keeps its timings
+            writer.writerow(row)
+            timingsFile.flush()
+            print("[%d/%d] %s %s (%s s)" % (len(rows) + 1, len(tasks), row['image'], row['status'], row['seconds']))
+            rows.append(row)
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finally:
+        timingsFile.close()
+    return sorted(rows, key=lambda r: r['job'])
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fill the holes of many images (see the module docstring for the manifest format).")
+    parser.add_argument('manifest', help="CSV of image, fill mask, texture mask[, output name]")
+    parser.add_argument('--out', default='results', help="output directory (default: results)")
+    parser.add_argument('--workers', type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument('--patchL', type=int, default=13, help="patch size is 2*patchL+1 (default: 13)")
+    parser.add_argument('--randomPatchSD', type=float, default=30, help="SD of the random patch selection (default: 30)")
+    parser.add_argument('--fillOrder', choices=scheduler.FILL_ORDERS, default='random')
+    parser.add_argument('--matchBackend', choices=matching.BACKENDS, default='exact')
+    parser.add_argument('--levels', type=int, default=1, help="multiscale pyramid levels (default: 1)")
+    parser.add_argument('--searchRadius', type=int, default=2, help="multiscale refinement search radius (default: 2)")
+    parser.add_argument('--seed', type=int, default=0, help="base random seed, job k uses seed+k (default: 0)")
+    args = parser.parse_args(argv)
+
+    rows = run_batch(read_manifest(args.manifest), args.out, args.workers, patchL=args.patchL,
+                     randomPatchSD=args.randomPatchSD, fillOrder=args.fillOrder, matchBackend=args.matchBackend,
+                     levels=args.levels, searchRadius=args.searchRadius, seed=args.seed)
+    failed = [row for row in rows if row['status'] != 'ok']
+    print("%d jobs, %d failed, timings in %s" % (len(rows), len(failed), os.path.join(args.out, 'timings.csv')))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,86 @@
+import numpy as np
+
+
+def find_edge(hole_mask):
+    """
+    Pixels of the hole (mask == 1) with at least one 4-neighbour outside the
+    hole, as a 0/1 array. Vectorized version of Holefill's Find_Edge; pixels
+    outside the image count as outside the hole.
+    """
+    hole = np.asarray(hole_mask) == 1
+    padded = np.pad(hole, 1, 'constant', constant_values=False)
+    inner = padded[:-2, 1:-1] & padded[2:, 1:-1] & padded[1:-1, :-2] & padded[1:-1, 2:]
+    return (hole & ~inner).astype(np.uint8)
+
+
+class FillFront(object):
+    """
+    The boundary of the region still to be filled, kept up to date
+    incrementally.
+
+    fillRegion is shared, not copied: fill_patch clears it under each copied
+    patch and re-examines only the pixels around that patch, so the cost
+    per step scales with the patch size instead of the image size.
+    """
+
+    def __init__(self, fillRegion):
+        self.fillRegion = fillRegion
+        self.remaining = int(np.count_nonzero(fillRegion))
+        self.edge = find_edge(fillRegion).astype(bool)
+        rows, cols = np.nonzero(self.edge)
+        self.pixels = list(zip(rows.tolist(), cols.tolist()))
+        self.index = dict((p, k) for k, p in enumerate(self.pixels))
+
+    def __len__(self):
+        return len(self.pixels)
+
+    def __contains__(self, pixel):
+        return pixel in self.index
+
+    def _add(self, pixel):
+        self.index[pixel] = len(self.pixels)
+        self.pixels.append(pixel)
+
+    def _remove(self, pixel):
+        # swap with the last pixel so removal is O(1)
+        k = self.index.pop(pixel)
+        last = self.pixels.pop()
+        if k < len(self.pixels):
+            self.pixels[k] = last
+            self.index[last] = k
+
+    def random_pixel(self):
+        # uniformly random front pixel, as (i, j)
+        return self.pixels[np.random.randint(0, len(self.pixels))]
+
+    def fill_patch(self, i, j, patchL):
+        """
+        Mark the (2*patchL+1)^2 patch centred on (i, j) as filled and update
+        the front in the patch and its one pixel border. Returns the list of
+        (i, j) pixels whose front membership changed.
+        """
+        rows, cols = self.fillRegion.shape
+        patch = self.fillRegion[max(i - patchL, 0):i + patchL + 1, max(j - patchL, 0):j + patchL + 1]
+        self.remaining -= int(np.count_nonzero(patch))
+        patch[...] = 0
+
+        # only pixels within one step of the patch can change edge status;
+        # recompute them from a window one pixel wider still, so that all
+        # their neighbours are real pixels (or the image border)
+        r0, r1 = max(i - patchL - 1, 0), min(i + patchL + 2, rows)
+        c0, c1 = max(j - patchL - 1, 0), min(j + patchL + 2, cols)
+        w0, w1 = max(r0 - 1, 0), min(r1 + 1, rows)
+        v0, v1 = max(c0 - 1, 0), min(c1 + 1, cols)
+        edge = find_edge(self.fillRegion[w0:w1, v0:v1]).astype(bool)[r0 - w0:r1 - w0, c0 - v0:c1 - v0]
+
+        changed = []
+        old = self.edge[r0:r1, c0:c1]
+        for di, dj in zip(*np.nonzero(old != edge)):
+            pixel = (int(r0 + di), int(c0 + dj))
+            if edge[di, dj]:
+                self._add(pixel)
+            else:
+                self._remove(pixel)
+            changed.append(pixel)
+        old[...] = edge
+        return changed
@@ -0,0 +1,165 @@
+import os.path
+import pickle
+import numpy as np
+from PIL import Image
+import fillfront
+import scheduler
+import matching
+import multiscale
+
+
+def copy_patch(imHole, TODOMask, textureIm, iPatchCenter, jPatchCenter, iMatchCenter, jMatchCenter, patchL):
+    # copy the texture patch centred on (iMatchCenter, jMatchCenter) into
+    # imHole around (iPatchCenter, jPatchCenter), only where TODOMask = 1
+    todo = np.asarray(TODOMask) == 1
+    holePatch = imHole[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1]
+    matchPatch = textureIm[iMatchCenter-patchL:iMatchCenter+patchL+1,jMatchCenter-patchL:jMatchCenter+patchL+1]
+    holePatch[todo] = matchPatch[todo] # from texture to hole
+    return imHole
+
+
+def bounding_box(region):
+    # (iMin, iMax, jMin, jMax) of the nonzero pixels of a region mask
+    indices = np.nonzero(region)
+    return min(indices[0]), max(indices[0]), min(indices[1]), max(indices[1])
+
+
+def check_regions(imShape, fillRegion, textureRegion, patchL):
+    # the same checks as the Holefill script, for any image and patch size
+    patchSize = 2*patchL+1
+    iFillMin, iFillMax, jFillMin, jFillMax = bounding_box(fillRegion)
+    assert((iFillMin >= patchL) and
+            (iFillMax < imShape[0] - patchL) and
+            (jFillMin >= patchL) and
+            (jFillMax < imShape[1] - patchL)) , "Hole is too close to edge of image for this patch size"
+    iTextureMin, iTextureMax, jTextureMin, jTextureMax = bounding_box(textureRegion)
+    assert((iTextureMax - iTextureMin + 1 > patchSize) and
+            (jTextureMax - jTextureMin + 1 > patchSize)) , "Texture image is smaller than patch size"
+
+
+def fill(imHole, fillRegion, textureIm, textureOrigin, patchL, randomPatchSD=30, fillOrder='random', matchBackend='exact', matcher=None, verbose=False):
+    """
+    Fill the hole of imHole with patches from textureIm.
+
+    Inputs:
+    ----------------
+    imHole          rows x cols x bands image, filled in place.
+
+    fillRegion      rows x cols mask of the pixels to fill (1), cleared in
+                    place as they are filled.
+
+    textureIm       The texture image, textureOrigin = (i, j) is the
+                    position of its top-left pixel in imHole.
+
+    patchL          Patch size is 2*patchL+1.
+
+    randomPatchSD   Standard deviation of the randomized patch selection.
+
+    fillOrder       'random' or 'priority', see scheduler.py.
+
+    matchBackend    'exact', 'patchmatch' or 'index', see matching.py. A
+                    ready-made matcher can be passed as matcher instead.
+
+    Output:
+    ----------------
+    imHole          The filled image.
+
+    source          rows x cols x 2 array with, for every filled pixel, the
+                    (i, j) image coordinates of the texture pixel copied
+                    into it, and -1 elsewhere.
+
+    stats           matching.MatchStats of the fill.
+    """
+    if matcher is None:
+        matcher = matching.make_matcher(matchBackend, textureIm, patchL, randomPatchSD, imHole.shape)
+    source = -np.ones(fillRegion.shape + (2,), dtype=np.int64)
+
+    # The fill front (pixels of fillRegion next to known pixels) is updated
+    # incrementally around each copied patch instead of rescanning the image
+    front = fillfront.FillFront(fillRegion)
+    fillScheduler = scheduler.make_scheduler(fillOrder, front, imHole, patchL)
+
+    while (front.remaining > 0):
+        if verbose:
+            print("Number of pixels remaining = %d" % front.remaining)
+
+        # Pick the next pixel from the fill front
+        iPatchCenter, jPatchCenter = fillScheduler.next()
+
+        # Define the coordinates for the TODOPatch
+        TODOPatch = imHole[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1,:]
+        TODOMask = fillRegion[iPatchCenter-patchL:iPatchCenter+patchL+1,jPatchCenter-patchL:jPatchCenter+patchL+1]
+
+        # Find a texture patch for TODOPatch (randomized selection of one of
+        # the best, see matching.py)
+        iSelectCenter, jSelectCenter, ssdValue = matcher.match(TODOPatch, TODOMask, iPatchCenter, jPatchCenter)
+
+        # Copy patch into hole, remembering where each pixel came from
+        matcher.copied(iPatchCenter,jPatchCenter,iSelectCenter,jSelectCenter,TODOMask)
+        di, dj = np.nonzero(np.asarray(TODOMask) == 1)
+        source[iPatchCenter + di - patchL, jPatchCenter + dj - patchL, 0] = textureOrigin[0] + iSelectCenter + di - patchL
+        source[iPatchCenter + di - patchL, jPatchCenter + dj - patchL, 1] = textureOrigin[1] + jSelectCenter + dj - patchL
+        imHole = copy_patch(imHole,TODOMask,textureIm,iPatchCenter,jPatchCenter,iSelectCenter,jSelectCenter,patchL)
+
+        # Update fillRegion, the fill front and the priorities around the patch only
+        fillScheduler.fill_patch(iPatchCenter, jPatchCenter, patchL)
+
+    return imHole, source, matcher.stats
+
+
+def load_region(path):
+    """
+    Load a region mask as a rows x cols uint8 array of 0/1. Accepts the
+    pickles written by polyselect.py (.pkl), NumPy arrays (.npy) and images
+    (.png or anything else PIL reads), where any nonzero pixel is in the
+    region.
+    """
+    ext = os.path.splitext(path)[1].lower()
+    if ext == '.pkl':
+        with open(path, 'rb') as f:
+            try:
+                region = pickle.load(f, encoding='latin1') # written by Python 2
+            except TypeError:
+                region = pickle.load(f)
+    elif ext == '.npy':
+        region = np.load(path)
+    else:
+        region = np.asarray(Image.open(path).convert('L'))
+    region = np.asarray(region)
+    assert region.ndim == 2, "Region mask must be 2D, got shape %s" % (region.shape,)
+    return (region != 0).astype(np.uint8)
+
+
+def fill_image(im_array, fillRegion, textureRegion, patchL=13, randomPatchSD=30, fillOrder='random', matchBackend='exact', multiscaleLevels=1, searchRadius=2, verbose=False):
+    """
+    Headless hole filling of a whole image: what the Holefill script does,
+    without files, prompts or windows. fillRegion and textureRegion are
+    rows x cols masks (nonzero = in the region), the texture used is the
+    bounding box of textureRegion. The inputs are not modified.
+
+    Output:
+    ----------------
+    result      The filled image, same shape and dtype as im_array.
+
+    stats       matching.MatchStats of the (finest level of the) fill.
+    """
+    im_array = np.asarray(im_array)
+    fillRegion = (np.asarray(fillRegion) != 0).astype(np.uint8)
+    textureRegion = np.asarray(textureRegion)
+    assert fillRegion.shape == im_array.shape[:2], "Fill region does not match the image size"
+    assert textureRegion.shape == im_array.shape[:2], "Texture region does not match the image size"
+    assert np.any(fillRegion), "Fill region is empty"
+    check_regions(im_array.shape, fillRegion, textureRegion, patchL)
+
+    if multiscaleLevels > 1:
+        result, timings = multiscale.fill_multiscale(im_array, fillRegion, textureRegion, patchL, multiscaleLevels,
+                                                     randomPatchSD, fillOrder, matchBackend, searchRadius, verbose)
+        return result, timings[-1][4]
+
+    iTextureMin, iTextureMax, jTextureMin, jTextureMax = bounding_box(textureRegion)
+    textureIm = im_array[iTextureMin:iTextureMax+1, jTextureMin:jTextureMax+1, :]
+    imHole = im_array.copy()
+    imHole[fillRegion != 0] = 0
+    result, source, stats = fill(imHole, fillRegion, textureIm, (iTextureMin, jTextureMin), patchL,
+                                 randomPatchSD, fillOrder, matchBackend, verbose=verbose)
+    return result, stats
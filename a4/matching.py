@@ -0,0 +1,219 @@
+import numpy as np
+import random
+import time
+import ssd
+import patchindex
+
+# matching backends accepted by make_matcher
+BACKENDS = ('exact', 'patchmatch', 'index')
+
+
+def gaussian_rank(n, randomPatchSD):
+    # rank of the patch to use among n sorted candidates: |N(0, SD)|,
+    # rounded and clipped, so the best few patches are the most likely
+    return int(min(round(abs(random.gauss(0,randomPatchSD))),n-1))
+
+
+class MatchStats(object):
+    """
+    Running quality and cost metrics of a matching backend: the SSD of
+    every chosen patch (also per compared pixel, which is comparable across
+    masks) and the time spent matching.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total_ssd = 0.0
+        self.total_pixel_ssd = 0.0
+        self.seconds = 0.0
+
+    def record(self, ssdValue, nValid, seconds):
+        self.count += 1
+        self.total_ssd += ssdValue
+        self.total_pixel_ssd += ssdValue / float(max(nValid, 1))
+        self.seconds += seconds
+
+    def mean_ssd(self):
+        return self.total_ssd / max(self.count, 1)
+
+    def mean_pixel_ssd(self):
+        return self.total_pixel_ssd / max(self.count, 1)
+
+    def __str__(self):
+        return "%d patches, mean SSD %.1f (%.2f per pixel), %.2f s matching" % (
+            self.count, self.mean_ssd(), self.mean_pixel_ssd(), self.seconds)
+
+
+class ExactMatcher(object):
+    """
+    Exhaustive search: the masked SSD against every texture patch (see
+    ssd.MaskedSSD), then the randomized selection of one of the best.
+    """
+
+    name = 'exact'
+
+    def __init__(self, textureIm, patchL, randomPatchSD):
+        self.patchL = patchL
+        self.randomPatchSD = randomPatchSD
+        self.engine = ssd.MaskedSSD(textureIm, patchL)
+        self.stats = MatchStats()
+
+    def match(self, TODOPatch, TODOMask, iPatchCenter, jPatchCenter):
+        """
+        Texture patch for the TODOPatch centred on (iPatchCenter,
+        jPatchCenter). Returns its centre in textureIm and its SSD.
+        """
+        start = time.time()
+        ssdIm = self.engine(TODOPatch, TODOMask)
+
+        # Randomized selection of one of the best texture patches
+        ssdIm1 = np.sort(np.copy(ssdIm),axis=None)
+        ssdValue = ssdIm1[gaussian_rank(np.size(ssdIm1), self.randomPatchSD)]
+        ssdIndex = np.nonzero(ssdIm==ssdValue)
+
+        # adjust i, j coordinates relative to textureIm
+        iSelectCenter = ssdIndex[0][0] + self.patchL
+        jSelectCenter = ssdIndex[1][0] + self.patchL
+        self.stats.record(ssdValue, np.count_nonzero(np.asarray(TODOMask) == 0), time.time() - start)
+        return iSelectCenter, jSelectCenter, ssdValue
+
+    def copied(self, iPatchCenter, jPatchCenter, iSelectCenter, jSelectCenter, TODOMask):
+        # nothing to remember between patches
+        pass
+
+
+class PatchMatcher(object):
+    """
+    Approximate nearest patch search in the style of PatchMatch (Barnes et
+    al. 2009). Every filled pixel remembers which texture pixel it came
+    from (the nearest-neighbour field). A query starts from a few random
+    texture patches plus the patches its already filled neighbours
+    propagate, keeping their relative offset. It then runs a random search
+    around the best so far, halving the radius each round. Only these
+    candidates get a masked SSD, so the cost per patch does not depend on
+    the texture size.
+
+    Accuracy knobs: nRandom (random initial candidates), samples (random
+    search candidates per radius) and rounds (random search passes).
+    """
+
+    name = 'patchmatch'
+
+    def __init__(self, textureIm, patchL, randomPatchSD, imShape, nRandom=8, samples=4, rounds=2):
+        self.patchL = patchL
+        self.patchSize = 2 * patchL + 1
+        self.randomPatchSD = randomPatchSD
+        self.nRandom = nRandom
+        self.samples = samples
+        self.rounds = rounds
+        self.stats = MatchStats()
+
+        # every texture patch, as a read-only strided view
+        self.windows = ssd.texture_windows(textureIm, patchL)
+        self.ssdRows, self.ssdCols = self.windows.shape[:2]
+        # nearest-neighbour field: texture centre each filled pixel came from
+        self.nnf = -np.ones(tuple(imShape[:2]) + (2,), dtype=np.int64)
+        # neighbours that propagate their match, near and a patch away
+        steps = (1, patchL)
+        self.neighbours = [(d * s, 0) for s in steps for d in (-1, 1)] + [(0, d * s) for s in steps for d in (-1, 1)]
+
+    def _clip(self, cands):
+        cands[:, 0] = np.clip(cands[:, 0], 0, self.ssdRows - 1)
+        cands[:, 1] = np.clip(cands[:, 1], 0, self.ssdCols - 1)
+        return cands
+
+    def match(self, TODOPatch, TODOMask, iPatchCenter, jPatchCenter):
+        """
+        Texture patch for the TODOPatch centred on (iPatchCenter,
+        jPatchCenter). Returns its centre in textureIm and its SSD.
+        """
+        start = time.time()
+
+        # random initial guesses plus propagation from filled neighbours
+        cands = [np.column_stack((np.random.randint(0, self.ssdRows, self.nRandom),
+                                  np.random.randint(0, self.ssdCols, self.nRandom)))]
+        rows, cols = self.nnf.shape[:2]
+        for di, dj in self.neighbours:
+            i, j = iPatchCenter + di, jPatchCenter + dj
+            if 0 <= i < rows and 0 <= j < cols and self.nnf[i, j, 0] >= 0:
+                # same offset as the neighbour, in SSD (top-left) coordinates
+                cands.append(self.nnf[i, j][np.newaxis] - (di, dj) - self.patchL)
+        cands = self._clip(np.concatenate(cands))
+        ssds = ssd.candidate_ssd(self.windows, cands, TODOPatch, TODOMask)
+
+        # random search around the best candidate, halving the radius
+        for _ in range(self.rounds):
+            radius = max(self.ssdRows, self.ssdCols)
+            while radius >= 1:
+                best = cands[np.argmin(ssds)]
+                new = self._clip(best + np.random.randint(-radius, radius + 1, (self.samples, 2)))
+                cands = np.concatenate((cands, new))
+                ssds = np.concatenate((ssds, ssd.candidate_ssd(self.windows, new, TODOPatch, TODOMask)))
+                radius //= 2
+
+        # randomized selection as in the exact search, with the rank scaled
+        # down from all texture patches to the candidates actually seen
+        cands, first = np.unique(cands, axis=0, return_index=True)
+        ssds = ssds[first]
+        order = np.argsort(ssds, kind='mergesort')
+        scale = len(order) / float(self.ssdRows * self.ssdCols)
+        k = order[gaussian_rank(len(order), self.randomPatchSD * scale)]
+
+        iSelectCenter = cands[k, 0] + self.patchL
+        jSelectCenter = cands[k, 1] + self.patchL
+        self.stats.record(ssds[k], np.count_nonzero(np.asarray(TODOMask) == 0), time.time() - start)
+        return iSelectCenter, jSelectCenter, ssds[k]
+
+    def copied(self, iPatchCenter, jPatchCenter, iSelectCenter, jSelectCenter, TODOMask):
+        # remember where every newly filled pixel came from
+        di, dj = np.nonzero(np.asarray(TODOMask) == 1)
+        di = di - self.patchL
+        dj = dj - self.patchL
+        self.nnf[iPatchCenter + di, jPatchCenter + dj, 0] = iSelectCenter + di
+        self.nnf[iPatchCenter + di, jPatchCenter + dj, 1] = jSelectCenter + dj
+
+
+class IndexMatcher(object):
+    """
+    Search through a precomputed PCA + KD-tree index of the texture patches
+    (see patchindex.PatchIndex). The top k candidates are re-ranked by exact
+    masked SSD, and the randomized selection picks among them with the
+    unchanged randomPatchSD: k covers three standard deviations of it.
+    """
+
+    name = 'index'
+
+    def __init__(self, textureIm, patchL, randomPatchSD, k=None):
+        self.patchL = patchL
+        self.randomPatchSD = randomPatchSD
+        self.k = k or max(16, int(3 * randomPatchSD) + 1)
+        self.index = patchindex.PatchIndex(textureIm, patchL)
+        self.stats = MatchStats()
+
+    def match(self, TODOPatch, TODOMask, iPatchCenter, jPatchCenter):
+        """
+        Texture patch for the TODOPatch centred on (iPatchCenter,
+        jPatchCenter). Returns its centre in textureIm and its SSD.
+        """
+        start = time.time()
+        cands, ssds = self.index.query(TODOPatch, TODOMask, self.k)
+        k = gaussian_rank(len(ssds), self.randomPatchSD)
+
+        iSelectCenter = cands[k, 0] + self.patchL
+        jSelectCenter = cands[k, 1] + self.patchL
+        self.stats.record(ssds[k], np.count_nonzero(np.asarray(TODOMask) == 0), time.time() - start)
+        return iSelectCenter, jSelectCenter, ssds[k]
+
+    def copied(self, iPatchCenter, jPatchCenter, iSelectCenter, jSelectCenter, TODOMask):
+        # the index only covers the texture, which never changes
+        pass
+
+
+def make_matcher(backend, textureIm, patchL, randomPatchSD, imShape):
+    # pick the matching backend by name, see BACKENDS
+    assert backend in BACKENDS, "Unknown matching backend %r" % (backend,)
+    if backend == 'patchmatch':
+        return PatchMatcher(textureIm, patchL, randomPatchSD, imShape)
+    if backend == 'index':
+        return IndexMatcher(textureIm, patchL, randomPatchSD)
+    return ExactMatcher(textureIm, patchL, randomPatchSD)
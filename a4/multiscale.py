@@ -0,0 +1,147 @@
+import time
+import numpy as np
+import ssd
+import inpaint
+import matching
+
+
+def downsample(im_array, fillRegion, textureRegion):
+    """
+    Halve an image and its region masks with 2 x 2 blocks (an odd last row
+    or column is dropped), so coarse pixel (i, j) covers fine pixels
+    (2i..2i+1, 2j..2j+1). The hole grows to every block that touches it and
+    the texture shrinks to the blocks that lie entirely inside it.
+    """
+    rows, cols = (fillRegion.shape[0] // 2) * 2, (fillRegion.shape[1] // 2) * 2
+    def blocks(a):
+        a = np.asarray(a)[:rows, :cols]
+        return a.reshape((rows // 2, 2, cols // 2, 2) + a.shape[2:])
+    im = np.rint(blocks(im_array).astype(np.float64).mean(axis=(1, 3))).astype(im_array.dtype)
+    fill = (blocks(fillRegion) != 0).any(axis=(1, 3)).astype(np.uint8)
+    texture = (blocks(textureRegion) != 0).all(axis=(1, 3)).astype(np.uint8)
+    return im, fill, texture
+
+
+def upsample_source(source, shape):
+    """
+    Predict, for every pixel of the finer level, the texture pixel it should
+    come from: the coarse source of its 2 x 2 block, scaled up, plus its
+    position in the block. -1 where the coarse level has no source.
+    """
+    i, j = np.indices(shape)
+    ci = np.minimum(i // 2, source.shape[0] - 1)
+    cj = np.minimum(j // 2, source.shape[1] - 1)
+    coarse = source[ci, cj]
+    guide = np.empty(tuple(shape) + (2,), dtype=np.int64)
+    guide[..., 0] = 2 * coarse[..., 0] + (i - 2 * ci)
+    guide[..., 1] = 2 * coarse[..., 1] + (j - 2 * cj)
+    guide[coarse[..., 0] < 0] = -1
+    return guide
+
+
+class GuidedMatcher(object):
+    """
+    Refinement search for a finer level: the exact masked SSD over a
+    (2*radius+1)^2 window of texture patches around the match predicted by
+    the coarser level (see upsample_source). Pixels without a prediction
+    fall back to a full matcher from make_fallback, built on first use.
+    """
+
+    name = 'guided'
+
+    def __init__(self, textureIm, textureOrigin, patchL, randomPatchSD, guide, radius, make_fallback):
+        self.patchL = patchL
+        self.textureOrigin = textureOrigin
+        self.randomPatchSD = randomPatchSD
+        self.guide = guide
+        self.make_fallback = make_fallback
+        self.fallback = None
+        self.windows = ssd.texture_windows(textureIm, patchL)
+        self.ssdRows, self.ssdCols = self.windows.shape[:2]
+        d = np.arange(-radius, radius + 1)
+        self.offsets = np.column_stack([a.ravel() for a in np.meshgrid(d, d, indexing='ij')])
+        self.stats = matching.MatchStats()
+
+    def match(self, TODOPatch, TODOMask, iPatchCenter, jPatchCenter):
+        start = time.time()
+        g = self.guide[iPatchCenter, jPatchCenter]
+        if g[0] < 0:
+            if self.fallback is None:
+                self.fallback = self.make_fallback()
+            iSelectCenter, jSelectCenter, ssdValue = self.fallback.match(TODOPatch, TODOMask, iPatchCenter, jPatchCenter)
+        else:
+            # predicted centre in SSD (top-left) coordinates of the texture
+            centre = g - self.textureOrigin - self.patchL
+            cands = centre + self.offsets
+            cands = cands[(cands[:, 0] >= 0) & (cands[:, 0] < self.ssdRows) &
+                          (cands[:, 1] >= 0) & (cands[:, 1] < self.ssdCols)]
+            if len(cands) == 0:
+                cands = np.clip(centre, 0, (self.ssdRows - 1, self.ssdCols - 1))[np.newaxis]
+            ssds = ssd.candidate_ssd(self.windows, cands, TODOPatch, TODOMask)
+
+            # randomized selection, rank scaled to the window as in PatchMatcher
+            order = np.argsort(ssds, kind='mergesort')
+            scale = len(order) / float(self.ssdRows * self.ssdCols)
+            k = order[matching.gaussian_rank(len(order), self.randomPatchSD * scale)]
+            iSelectCenter = cands[k, 0] + self.patchL
+            jSelectCenter = cands[k, 1] + self.patchL
+            ssdValue = ssds[k]
+        self.stats.record(ssdValue, np.count_nonzero(np.asarray(TODOMask) == 0), time.time() - start)
+        return iSelectCenter, jSelectCenter, ssdValue
+
+    def copied(self, iPatchCenter, jPatchCenter, iSelectCenter, jSelectCenter, TODOMask):
+        if self.fallback is not None:
+            self.fallback.copied(iPatchCenter, jPatchCenter, iSelectCenter, jSelectCenter, TODOMask)
+
+
+def fill_multiscale(im_array, fillRegion, textureRegion, patchL, levels=3, randomPatchSD=30, fillOrder='random', matchBackend='exact', searchRadius=2, verbose=False):
+    """
+    Coarse-to-fine hole filling. The image and both region masks are halved
+    levels-1 times; the coarsest level is filled with the chosen backend,
+    and every finer level is refilled with a GuidedMatcher that only
+    searches searchRadius texture pixels around the upsampled coarse match.
+    patchL and randomPatchSD shrink with the level so that patches and the
+    selection rank cover the same part of the image at every level.
+
+    Output:
+    ----------------
+    imHole      The filled full resolution image.
+
+    timings     One (level, (rows, cols), patchL, seconds, stats) tuple per
+                level, coarsest first. Also printed when verbose.
+    """
+    pyramid = [(np.asarray(im_array), np.asarray(fillRegion), np.asarray(textureRegion))]
+    for level in range(1, levels):
+        pyramid.append(downsample(*pyramid[-1]))
+
+    timings = []
+    guide = None
+    for level in reversed(range(levels)):
+        im, fill, texture = pyramid[level]
+        levelL = max(1, patchL >> level)
+        levelSD = randomPatchSD / 4.0 ** level # 4x fewer texture patches per level
+        inpaint.check_regions(im.shape, fill, texture, levelL)
+
+        imHole = im.copy()
+        imHole[fill != 0] = 0
+        iTextureMin, iTextureMax, jTextureMin, jTextureMax = inpaint.bounding_box(texture)
+        textureIm = im[iTextureMin:iTextureMax+1, jTextureMin:jTextureMax+1, :]
+        origin = np.array((iTextureMin, jTextureMin))
+
+        def make_fallback(textureIm=textureIm, levelL=levelL, levelSD=levelSD, shape=im.shape):
+            return matching.make_matcher(matchBackend, textureIm, levelL, levelSD, shape)
+        matcher = None
+        if guide is not None:
+            matcher = GuidedMatcher(textureIm, origin, levelL, levelSD, guide, searchRadius, make_fallback)
+
+        start = time.time()
+        imHole, source, stats = inpaint.fill(imHole, fill.copy(), textureIm, origin, levelL,
+                                             levelSD, fillOrder, matchBackend, matcher)
+        seconds = time.time() - start
+        timings.append((level, fill.shape, levelL, seconds, stats))
+        if verbose:
+            print("Level %d (%dx%d, patchL=%d): %.2f s, %s" % (level, fill.shape[0], fill.shape[1], levelL, seconds, stats))
+
+        if level > 0:
+            guide = upsample_source(source, pyramid[level - 1][1].shape)
+    return imHole, timings
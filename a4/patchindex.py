@@ -0,0 +1,71 @@
+import numpy as np
+from scipy.spatial import cKDTree
+import ssd
+
+# defaults for PatchIndex
+PCA_COMPONENTS = 24
+PCA_SAMPLES = 4000
+
+
+class PatchIndex(object):
+    """
+    One-time index over every patch of a texture image: the flattened
+    patches are reduced with PCA and stored in a KD-tree.
+
+    Queries are masked: the known pixels of the TODOPatch are projected
+    onto the PCA basis by least squares over those pixels only (a
+    mask-aware projection), the tree returns the nearest k candidates, and
+    these are re-ranked by their exact masked SSD.
+    """
+
+    def __init__(self, textureIm, patchL, nComponents=PCA_COMPONENTS, nSamples=PCA_SAMPLES, seed=0):
+        self.patchL = patchL
+        self.windows = ssd.texture_windows(textureIm, patchL)
+        ssdRows, ssdCols = self.windows.shape[:2]
+        self.shape = (ssdRows, ssdCols)
+
+        # fit PCA on a random subset of the patches, the texture is usually
+        # far more redundant than its patch count suggests
+        rng = np.random.RandomState(seed)
+        n = ssdRows * ssdCols
+        pick = rng.choice(n, nSamples, replace=False) if n > nSamples else np.arange(n)
+        sample = self.windows[np.unravel_index(pick, self.shape)].reshape(len(pick), -1).astype(np.float64)
+        self.mean = np.mean(sample, axis=0)
+        u, s, vt = np.linalg.svd(sample - self.mean, full_matrices=False)
+        self.basis = vt[:min(nComponents, len(s))].T # D x k
+
+        # project one row of patches at a time, never holding all of them
+        coords = np.empty((n, self.basis.shape[1]))
+        for r in range(ssdRows):
+            rowPatches = self.windows[r].reshape(ssdCols, -1) - self.mean
+            coords[r * ssdCols:(r + 1) * ssdCols] = np.dot(rowPatches, self.basis)
+        self.tree = cKDTree(coords)
+
+    def __len__(self):
+        return self.shape[0] * self.shape[1]
+
+    def project(self, TODOPatch, TODOMask, ridge=1e-3):
+        # PCA coordinates that best explain the known pixels of the patch
+        known = np.repeat((np.asarray(TODOMask) == 0).ravel(), np.shape(TODOPatch)[2])
+        if not np.any(known):
+            return np.zeros(self.basis.shape[1])
+        b = self.basis[known]
+        y = np.asarray(TODOPatch, dtype=np.float64).ravel()[known] - self.mean[known]
+        # scale the ridge with the number of known pixels so that a patch
+        # with few known pixels falls back towards the mean patch
+        a = np.dot(b.T, b) + ridge * len(y) * np.eye(b.shape[1])
+        return np.linalg.solve(a, np.dot(b.T, y))
+
+    def query(self, TODOPatch, TODOMask, k):
+        """
+        The k nearest texture patches in PCA space, re-ranked by exact masked
+        SSD. Returns their (row, col) offsets in the SSD map and their SSDs,
+        best first.
+        """
+        k = min(k, len(self))
+        dist, idx = self.tree.query(self.project(TODOPatch, TODOMask), k)
+        idx = np.atleast_1d(idx)
+        cands = np.column_stack(np.unravel_index(idx, self.shape))
+        ssds = ssd.candidate_ssd(self.windows, cands, TODOPatch, TODOMask)
+        order = np.argsort(ssds, kind='mergesort')
+        return cands[order], ssds[order]
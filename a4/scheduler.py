@@ -0,0 +1,130 @@
+import heapq
+import numpy as np
+
+# fill orders accepted by make_scheduler
+FILL_ORDERS = ('random', 'priority')
+
+
+class RandomScheduler(object):
+    """
+    The original fill order: a uniformly random pixel of the fill front.
+    """
+
+    def __init__(self, front):
+        self.front = front
+
+    def next(self):
+        return self.front.random_pixel()
+
+    def fill_patch(self, i, j, patchL):
+        # mark the patch filled, the front updates itself around it
+        return self.front.fill_patch(i, j, patchL)
+
+
+class PriorityScheduler(object):
+    """
+    Criminisi-style fill order: the front pixel p with the highest
+    priority C(p) * D(p) goes first.
+
+    C(p), the confidence, is the mean confidence of the patch around p,
+    where known pixels start at 1, hole pixels at 0, and filled pixels
+    inherit the confidence of the patch that filled them. D(p), the data
+    term, is |isophote . normal| / alpha: how strongly an image edge runs
+    into the front at p. Together they grow linear structures into the hole
+    first and keep low-confidence pixels for last.
+
+    Priorities live in a heap with lazy deletion. After each patch only the
+    front pixels whose patch overlaps it are re-scored, so a step costs
+    O(patchL^3) no matter how big the image or hole is, and every step
+    fills at least the chosen pixel, so a fill takes at most as many steps
+    as there are hole pixels.
+    """
+
+    def __init__(self, front, imHole, patchL, alpha=255.0, epsilon=1e-3):
+        self.front = front
+        self.imHole = imHole
+        self.patchL = patchL
+        self.alpha = alpha
+        self.epsilon = epsilon # keeps confidence ordering where D(p) = 0
+        self.confidence = 1.0 - (np.asarray(front.fillRegion) != 0)
+        self.heap = []
+        self.version = {}
+        self._push(front.pixels)
+
+    def _window(self, a, i, j, r):
+        return a[max(i - r, 0):i + r + 1, max(j - r, 0):j + r + 1]
+
+    def _confidence(self, i, j):
+        return np.sum(self._window(self.confidence, i, j, self.patchL)) / float((2 * self.patchL + 1) ** 2)
+
+    def _data(self, i, j):
+        # normal to the front: gradient of the hole mask at (i, j)
+        hole = self._window(self.front.fillRegion, i, j, 1).astype(np.float64)
+        if hole.shape != (3, 3):
+            return 0.0
+        ni, nj = np.gradient(hole)
+        ni, nj = ni[1, 1], nj[1, 1]
+        norm = np.hypot(ni, nj)
+        if norm == 0:
+            return 0.0
+
+        # isophote: strongest gradient over the known part of the patch,
+        # rotated by 90 degrees (only where all 4 neighbours are known)
+        patch = self._window(self.imHole, i, j, self.patchL).astype(np.float64)
+        known = self._window(self.front.fillRegion, i, j, self.patchL) == 0
+        if patch.ndim == 3:
+            patch = np.mean(patch, axis=2)
+        if min(patch.shape) < 3:
+            return 0.0
+        gi, gj = np.gradient(patch)
+        valid = known.copy()
+        valid[1:, :] &= known[:-1, :]
+        valid[:-1, :] &= known[1:, :]
+        valid[:, 1:] &= known[:, :-1]
+        valid[:, :-1] &= known[:, 1:]
+        magnitude = np.where(valid, np.hypot(gi, gj), -1)
+        k = np.argmax(magnitude)
+        if magnitude.flat[k] <= 0:
+            return 0.0
+        iso_i, iso_j = -gj.flat[k], gi.flat[k]
+        return abs(iso_i * ni + iso_j * nj) / norm / self.alpha
+
+    def priority(self, i, j):
+        return self._confidence(i, j) * (self._data(i, j) + self.epsilon)
+
+    def _push(self, pixels):
+        for pixel in pixels:
+            version = self.version.get(pixel, 0) + 1
+            self.version[pixel] = version
+            heapq.heappush(self.heap, (-self.priority(*pixel), pixel, version))
+
+    def next(self):
+        # drop stale entries (re-scored or no longer on the front)
+        while self.heap:
+            priority, pixel, version = self.heap[0]
+            if pixel in self.front and self.version.get(pixel) == version:
+                return pixel
+            heapq.heappop(self.heap)
+        raise IndexError("fill front is empty")
+
+    def fill_patch(self, i, j, patchL):
+        # filled pixels inherit the confidence of this patch
+        c = self._confidence(i, j)
+        todo = self._window(self.front.fillRegion, i, j, patchL) != 0
+        self._window(self.confidence, i, j, patchL)[todo] = c
+
+        self.front.fill_patch(i, j, patchL)
+
+        # re-score the front pixels whose patch overlaps the filled one
+        r = patchL + self.patchL + 1
+        edge = self._window(self.front.edge, i, j, r)
+        rows, cols = np.nonzero(edge)
+        self._push(zip((rows + max(i - r, 0)).tolist(), (cols + max(j - r, 0)).tolist()))
+
+
+def make_scheduler(order, front, imHole, patchL):
+    # pick the fill order by name, see FILL_ORDERS
+    assert order in FILL_ORDERS, "Unknown fill order %r" % (order,)
+    if order == 'priority':
+        return PriorityScheduler(front, imHole, patchL)
+    return RandomScheduler(front)
@@ -0,0 +1,149 @@
+import numpy as np
+import time
+from scipy import fftpack
+
+
+def masked_ssd_loop(TODOPatch, TODOMask, textureIm, patchL):
+    """
+    Reference masked SSD, the original four nested loops of ComputeSSD.
+    Far too slow for real use, kept to check MaskedSSD against.
+    """
+    patch_rows, patch_cols, patch_bands = np.shape(TODOPatch)
+    tex_rows, tex_cols, tex_bands = np.shape(textureIm)
+    ssd_rows = tex_rows - 2 * patchL
+    ssd_cols = tex_cols - 2 * patchL
+    SSD = np.zeros((ssd_rows,ssd_cols))
+
+    for r in range(ssd_rows):
+        for c in range(ssd_cols):
+            temp = 0
+            for y in range(patch_rows):  # iterate around the patch per pixel of SSD
+                for x in range(patch_cols):
+                    if(TODOMask[y][x]==0): # check only valid areas
+                        temp += np.sum((textureIm[r+y][c+x]*1.0 - TODOPatch[y][x]*1.0)**2) # store SSD per pixel in temp
+            SSD[r][c] = temp
+    return SSD
+
+
+class MaskedSSD(object):
+    """
+    Masked sum of squared differences between a patch and every patch of a
+    fixed texture image.
+
+    With V = 1 where TODOMask == 0 (pixels to compare), T the texture and P
+    the patch, the SSD at texture offset (r, c) expands to
+
+        sum V*T(r,c)^2  -  2 sum V*P*T(r,c)  +  sum V*P^2
+
+    The first two terms are correlations of the texture with V and V*P,
+    computed with FFTs; the texture transforms are computed once here and
+    reused for every patch.
+    """
+
+    def __init__(self, textureIm, patchL):
+        self.patchL = patchL
+        self.patchSize = 2 * patchL + 1
+        texture = np.asarray(textureIm)
+        self.exact = np.issubdtype(texture.dtype, np.integer)
+        texture = texture.astype(np.float64)
+        rows, cols, bands = texture.shape
+        assert rows >= self.patchSize and cols >= self.patchSize, "Texture image is smaller than patch size"
+
+        # circular correlation is enough for the 'valid' part, as long as
+        # the transform is at least as big as the texture
+        self.shape = (fftpack.next_fast_len(rows), fftpack.next_fast_len(cols))
+        self.valid = (slice(self.patchSize - 1, rows), slice(self.patchSize - 1, cols))
+        self.tex_fft = np.fft.rfft2(texture, self.shape, axes=(0, 1))
+        self.tex2_fft = np.fft.rfft2(np.sum(np.square(texture), axis=2), self.shape)
+
+    def _correlate(self, kernel_fft):
+        return np.fft.irfft2(kernel_fft, self.shape)[self.valid]
+
+    def __call__(self, TODOPatch, TODOMask):
+        exact = self.exact and np.issubdtype(np.asarray(TODOPatch).dtype, np.integer)
+        patch = np.asarray(TODOPatch, dtype=np.float64)
+        valid = (np.asarray(TODOMask) == 0).astype(np.float64)
+        vp = patch * valid[:, :, np.newaxis]
+
+        # correlation = convolution with the flipped kernel
+        v_fft = np.fft.rfft2(valid[::-1, ::-1], self.shape)
+        vp_fft = np.fft.rfft2(vp[::-1, ::-1, :], self.shape, axes=(0, 1))
+        sum_t2 = self._correlate(self.tex2_fft * v_fft)
+        sum_pt = self._correlate(np.sum(self.tex_fft * vp_fft, axis=2))
+        SSD = sum_t2 - 2 * sum_pt + np.sum(vp * patch)
+
+        if exact:
+            # integer images give integer SSDs, rounding removes the FFT
+            # noise and makes ties (and the random selection) match the loop
+            SSD = np.rint(SSD)
+        return np.maximum(SSD, 0)
+
+
+def texture_windows(textureIm, patchL):
+    """
+    Every (2*patchL+1)^2 patch of textureIm as a read-only strided view of
+    shape (ssd_rows, ssd_cols, patchSize, patchSize, bands), indexed like
+    the SSD map.
+    """
+    texture = np.ascontiguousarray(textureIm)
+    rows, cols, bands = texture.shape
+    patchSize = 2 * patchL + 1
+    s0, s1, s2 = texture.strides
+    return np.lib.stride_tricks.as_strided(
+        texture, (rows - 2 * patchL, cols - 2 * patchL, patchSize, patchSize, bands),
+        (s0, s1, s0, s1, s2), writeable=False)
+
+
+def candidate_ssd(windows, cands, TODOPatch, TODOMask):
+    # masked SSD of TODOPatch against a batch of (row, col) texture offsets
+    t = windows[cands[:, 0], cands[:, 1]].astype(np.float64)
+    valid = (np.asarray(TODOMask) == 0)[:, :, np.newaxis]
+    d = (t - np.asarray(TODOPatch, dtype=np.float64)) * valid
+    return np.sum(d * d, axis=(1, 2, 3))
+
+
+def masked_ssd(TODOPatch, TODOMask, textureIm, patchL):
+    # one-off masked SSD, build a MaskedSSD to reuse the texture transforms
+    return MaskedSSD(textureIm, patchL)(TODOPatch, TODOMask)
+
+
+def check(trials=20, patchL=3, seed=0, rtol=1e-9):
+    """
+    Regression check of MaskedSSD against masked_ssd_loop on small random
+    inputs, both uint8 images (which must match exactly) and float images
+    (within rtol of the largest SSD). Returns the largest difference seen
+    for the float images.
+    """
+    rng = np.random.RandomState(seed)
+    worst = 0.0
+    for _ in range(trials):
+        size = 2 * patchL + 1
+        textureIm = rng.randint(0, 256, (rng.randint(size, 3 * size), rng.randint(size, 3 * size), 3)).astype(np.uint8)
+        TODOPatch = rng.randint(0, 256, (size, size, 3)).astype(np.uint8)
+        TODOMask = (rng.rand(size, size) < 0.4).astype(np.uint8)
+        expected = masked_ssd_loop(TODOPatch, TODOMask, textureIm, patchL)
+        actual = masked_ssd(TODOPatch, TODOMask, textureIm, patchL)
+        assert actual.shape == expected.shape, "SSD map has the wrong shape"
+        assert np.array_equal(actual, expected), "SSD map differs from the loop version"
+
+        textureIm = textureIm + rng.rand(*textureIm.shape)
+        TODOPatch = TODOPatch + rng.rand(*TODOPatch.shape)
+        expected = masked_ssd_loop(TODOPatch, TODOMask, textureIm, patchL)
+        difference = np.max(np.abs(masked_ssd(TODOPatch, TODOMask, textureIm, patchL) - expected))
+        assert difference <= rtol * max(np.max(expected), 1.0), "SSD map differs from the loop version"
+        worst = max(worst, difference)
+    return worst
+
+
+if __name__ == '__main__':
+    print("max difference from the loop version for float images: %g" % check())
+    textureIm = np.random.randint(0, 256, (120, 160, 3)).astype(np.uint8)
+    patchL = 13
+    size = 2 * patchL + 1
+    TODOPatch = textureIm[:size, :size]
+    TODOMask = (np.random.rand(size, size) < 0.5).astype(np.uint8)
+    engine = MaskedSSD(textureIm, patchL)
+    start = time.time()
+    for _ in range(10):
+        engine(TODOPatch, TODOMask)
+    print("patchL=%d on a %dx%d texture: %.2f ms per patch" % (patchL, textureIm.shape[0], textureIm.shape[1], (time.time() - start) * 100))
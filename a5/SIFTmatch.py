@@ -1,37 +1,16 @@
 from PIL import Image, ImageDraw
-from random import randint
 import numpy as np
-import csv
-import math
+import matcher
+import keyfile
+import consensus
 
 def ReadKeys(image):
+    # keypoints (row, col, scale, orientation) and unit length descriptors,
+    # as count x 4 and count x 128 arrays, parsed in one go and cached next
+    # to the .key file (see keyfile.py)
     im = Image.open(image+'.pgm').convert('RGB')
-    keypoints = []
-    descriptors = []
-    first = True
-    with open(image+'.key','rb') as f:
-        reader = csv.reader(f, delimiter=' ', quoting=csv.QUOTE_NONNUMERIC,skipinitialspace = True)
-        descriptor = []
-        for row in reader:
-            if len(row) == 2:
-                assert first, "Invalid keypoint file header."
-                assert row[1] == 128, "Invalid keypoint descriptor length in header (should be 128)."
-                count = row[0]
-                first = False
-            if len(row) == 4:
-                keypoints.append(np.array(row))
-            if len(row) == 20:
-                descriptor += row
-            if len(row) == 8:
-                descriptor += row
-                assert len(descriptor) == 128, "Keypoint descriptor length invalid (should be 128)."
-                #normalize the key to unit length
-                descriptor = np.array(descriptor)
-                descriptor = descriptor / math.sqrt(np.sum(np.power(descriptor,2)))
-                descriptors.append(descriptor)
-                descriptor = []
-    assert len(keypoints) == count, "Incorrect total number of keypoints read."
-    print "Number of keypoints read:", int(count)
+    keypoints, descriptors = keyfile.load_keys(image+'.key')
+    print "Number of keypoints read:", len(keypoints)
     return [im,keypoints,descriptors]
 
 def AppendImages(im1, im2):
@@ -52,48 +31,17 @@ def DisplayMatches(im1, im2, matched_pairs):
     im3.save("matchings_q4","JPEG")
     return im3
 
-# consulted stackoverflow for finding angular distance
-def angularDistance(o1, o2):
-	phi = abs(o2 - o1) % (2*math.pi)
-	dist = phi
-	if(phi > math.pi): # it's wrapping around
-		dist = 2*math.pi - phi
-	return dist
-
-def ransac(matched_pairs, keypoints1, keypoints2):
-	repeat = 10 # do 10 repeats
-	orientation_t = 50 # change in orientation must be within 50 degrees
-	scale_t = 0.55 # scale must agree within 55%
-
-	best_overall = [] # remember our best overall
-
-	for i in range(repeat): 
-		rand_m = matched_pairs[randint(0,len(matched_pairs)-1)] # pick a random pair
-		scale = abs(rand_m[0][2] - rand_m[1][2]) # calculate difference in scale
-		orientation = abs(rand_m[0][3] - rand_m[1][3]) # calculate difference in orientation
-		
-		best_curr = [] # remember our best current set
-
-		for m1, m2 in matched_pairs: # now check every other matching pair 
-			scale_temp = abs(m1[2] - m2[2]) # calculate our scale difference again
-			orientation_temp = abs(m1[3] - m2[3]) # calculate orientation again
-
-			# change of scale does not agree within plus or minus scale_t 
-			if(scale_t * max(scale_temp, scale) > min(scale_temp, scale_t)):
-				continue
-
-			# change of orientation between the two keypoints of each match beyond orientation_t
-			dist = angularDistance(orientation, orientation_temp)
-			if (dist > math.radians(orientation_t)):
-				continue
-
-			# this current match is within our thresholds and we can add it
-			best_curr.append([m1,m2])
-
-		if(len(best_overall) < len(best_curr)): # if we've found a longer supporting set
-			best_overall = best_curr
-
-	return best_overall
+def ransac(matched_pairs, keypoints1, keypoints2, model=None):
+	# keep the largest set of matches that agree on the change of scale and
+	# orientation, evaluated for all matches at once and with as many
+	# repeats as the inlier ratio calls for (see consensus.py). With a model
+	# ('similarity' or 'affine') the set is also verified geometrically
+	if len(matched_pairs) == 0:
+		return []
+	k1 = np.array([m[0] for m in matched_pairs])
+	k2 = np.array([m[1] for m in matched_pairs])
+	inliers, T, iterations = consensus.ransac(k1, k2, model=model)
+	return [matched_pairs[m] for m in np.nonzero(inliers)[0]]
 
 def match(image1,image2):
     im1, keypoints1, descriptors1 = ReadKeys(image1)
@@ -101,19 +49,10 @@ def match(image1,image2):
     
     t = 0.68 # pick a threshold
 
-    #Generate matches
-    matched_pairs = [] # matching keypoints
-
-    for i in range(len(descriptors1)):
-    	matches = {} # remember our in a map
-    	for j in range(len(descriptors2)):
-    		matches[(math.acos(np.dot(descriptors1[i],descriptors2[j])))] = (i,j) # compute the angle between d1[i] d2[j] and map it to our two indices
-
-    	sorted_m = sorted(matches) # sort map based on angle of keys
-
-    	if(sorted_m[0]/sorted_m[1] < t): # the ratio of best to second best below threshold
-    		i_match, j_match = matches[sorted_m[0]] # take the indices of the best match
-    		matched_pairs.append([keypoints1[i_match],keypoints2[j_match]]) # append a new tuple to matched_pairs
+    #Generate matches: all angles at once, keeping the best match if its
+    #angle is below t times the second best (see matcher.py)
+    i_match, j_match, angles = matcher.match_descriptors(descriptors1, descriptors2, t)
+    matched_pairs = [[keypoints1[i],keypoints2[j]] for i, j in zip(i_match, j_match)] # matching keypoints
 
     matched_pairs = ransac(matched_pairs, keypoints1, keypoints2) # call ransac 
     im3 = DisplayMatches(im1, im2, matched_pairs)
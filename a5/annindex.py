@@ -0,0 +1,223 @@
+"""
+Approximate nearest neighbour index over the SIFT descriptors of a gallery
+of images, for matching a query image against all of them at once.
+
+The index is a forest of KD-trees (in the spirit of the randomized
+KD-trees of Silpa-Anan and Hartley, as used by FLANN): every tree is built
+on the descriptors under its own random rotation, so the trees split on
+different directions and the neighbours one tree misses another usually
+finds. KD-trees do poorly in 128 dimensions, so the trees are built on
+the first DIMS principal components of the descriptors (rotated at random
+within that subspace). Each tree is searched approximately (cKDTree's
+eps), and the candidates of all trees are merged and re-ranked by their
+exact angle in the full 128 dimensions.
+
+Accuracy knobs, from fastest to most accurate:
+
+    dims        principal components the trees are built on
+    nTrees      number of trees (more trees, more candidates)
+    checks      neighbours taken from every tree
+    eps         approximation of every tree search, 0 is exact
+
+The index is built once per gallery and saved with np.savez; the trees
+themselves are rebuilt from the saved projections when it is loaded.
+"""
+import time
+import numpy as np
+from scipy.spatial import cKDTree
+import matcher
+import keyfile
+
+# defaults for DescriptorIndex
+DIMS = 16
+N_TREES = 4
+CHECKS = 16
+EPS = 3.0
+NEIGHBOURS = 16
+PCA_SAMPLES = 20000
+CHUNK = 1024
+
+
+def random_rotation(dim, rng):
+    # uniformly random orthogonal matrix (QR of a Gaussian matrix)
+    q, r = np.linalg.qr(rng.randn(dim, dim))
+    return q * np.sign(np.diag(r))
+
+
+class DescriptorIndex(object):
+    """
+    Index over the descriptors of a gallery of images. descriptors is a
+    list with the N x 128 unit length descriptors of every image, names the
+    matching list of image names.
+    """
+
+    def __init__(self, descriptors, names=None, dims=DIMS, nTrees=N_TREES, checks=CHECKS, eps=EPS, seed=0, projections=None):
+        arrays = [matcher.as_matrix(d, np.float32) for d in descriptors]
+        self.names = list(names) if names is not None else [str(k) for k in range(len(arrays))]
+        assert len(self.names) == len(arrays), "Need one name per image"
+        self.descriptors = np.concatenate(arrays) if arrays else np.zeros((0, 128), dtype=np.float32)
+        # descriptors of image m are rows offsets[m]:offsets[m+1]
+        self.offsets = np.concatenate(([0], np.cumsum([len(a) for a in arrays]))).astype(np.intp)
+        self.image = np.repeat(np.arange(len(arrays)), np.diff(self.offsets))
+        self.checks = checks
+        self.eps = eps
+        if projections is None:
+            projections = self.random_projections(dims, nTrees, np.random.RandomState(seed))
+        # 128 x dims projection of every tree
+        self.projections = [np.asarray(p, dtype=np.float32) for p in projections]
+        self.trees = [cKDTree(np.dot(self.descriptors, p)) for p in self.projections]
+
+    def random_projections(self, dims, nTrees, rng):
+        # principal directions of (a sample of) the descriptors, rotated at
+        # random within their span for every tree
+        n = len(self.descriptors)
+        sample = self.descriptors[rng.choice(n, PCA_SAMPLES, replace=False)] if n > PCA_SAMPLES else self.descriptors
+        u, s, vt = np.linalg.svd(sample - np.mean(sample, axis=0), full_matrices=False)
+        basis = vt[:min(dims, len(s))].T
+        return [np.dot(basis, random_rotation(basis.shape[1], rng)) for _ in range(nTrees)]
+
+    def __len__(self):
+        return len(self.descriptors)
+
+    def save(self, path):
+        np.savez(path, descriptors=self.descriptors, offsets=self.offsets, names=np.array(self.names),
+                 projections=np.array(self.projections), checks=self.checks, eps=self.eps)
+
+    @classmethod
+    def load(cls, path, checks=None, eps=None):
+        # the saved index, optionally with other search knobs
+        data = np.load(path)
+        offsets = data['offsets']
+        descriptors = [data['descriptors'][offsets[m]:offsets[m + 1]] for m in range(len(offsets) - 1)]
+        return cls(descriptors, [str(n) for n in data['names']],
+                   checks=int(data['checks']) if checks is None else checks,
+                   eps=float(data['eps']) if eps is None else eps, projections=data['projections'])
+
+    def query(self, descriptors, k=NEIGHBOURS):
+        """
+        The k approximate nearest gallery descriptors of every query
+        descriptor. Returns N x k arrays of their rows in the index and their
+        angles, nearest first. Neighbours that were not found have row -1
+        and angle pi.
+        """
+        q = matcher.as_matrix(descriptors, np.float32)
+        n = len(q)
+        rows = -np.ones((n, k), dtype=np.intp)
+        angles = np.full((n, k), np.pi, dtype=np.float32)
+        checks = min(max(self.checks, k), len(self))
+        if n == 0 or checks == 0:
+            return rows, angles
+        for start in range(0, n, CHUNK):
+            block = q[start:start + CHUNK]
+            cands = np.concatenate([tree.query(np.dot(block, p), checks, eps=self.eps)[1].reshape(len(block), -1)
+                                    for p, tree in zip(self.projections, self.trees)], axis=1)
+            # merge the candidates of all trees: sorted, each one once
+            cands.sort(axis=1)
+            valid = cands < len(self)
+            valid[:, 1:] &= cands[:, 1:] != cands[:, :-1]
+            cands[~valid] = 0
+            sim = np.einsum('nd,nkd->nk', block, self.descriptors[cands])
+            sim[~valid] = -np.inf
+            best = np.argsort(-sim, axis=1, kind='mergesort')[:, :k]
+            bestSim = np.take_along_axis(sim, best, axis=1)
+            found = np.isfinite(bestSim)
+            kk = best.shape[1]
+            rows[start:start + CHUNK, :kk] = np.where(found, np.take_along_axis(cands, best, axis=1), -1)
+            angles[start:start + CHUNK, :kk] = np.where(found, np.arccos(np.clip(bestSim, -1.0, 1.0)), np.pi)
+        return rows, angles
+
+    def match(self, descriptors, ratio=matcher.RATIO, k=NEIGHBOURS):
+        """
+        Match the query descriptors against every gallery image with the
+        ratio test of matcher.match_descriptors, applied per image: the best
+        neighbour in an image must be closer than ratio times the second
+        best in the same image. If the second best of an image is not among
+        the k neighbours, the k-th neighbour's angle is used instead. The
+        approximate search can miss the true second best and let a bad match
+        through, so the few matches that pass are verified with the exact
+        top two of their image (matcher.top2): every match returned is one
+        the exact matcher makes too.
+
+        Output:
+        ----------------
+        matches     One (i, j, angle) tuple of arrays per gallery image, as
+                    from matcher.match_descriptors, j indexing the
+                    descriptors of that image.
+        """
+        rows, angles = self.query(descriptors, k)
+        image = np.where(rows >= 0, self.image[np.maximum(rows, 0)], -1)
+        # same[n, a, b]: neighbours a and b of query n are in the same image
+        same = (image[:, :, np.newaxis] == image[:, np.newaxis, :]) & (image[:, :, np.newaxis] >= 0)
+        earlier = np.tril(np.ones((k, k), dtype=bool), -1)
+        first = ~np.any(same & earlier, axis=2) & (image >= 0)
+        later = same & earlier.T
+        hasNext = np.any(later, axis=2)
+        nextAngle = np.where(hasNext, np.take_along_axis(angles, np.argmax(later, axis=2), axis=1), angles[:, -1:])
+        keep = first & (angles < ratio * nextAngle)
+
+        q, c = np.nonzero(keep)
+        candImage = image[q, c]
+        d = matcher.as_matrix(descriptors, np.float32)
+        matches = []
+        for m in range(len(self.names)):
+            i = q[candImage == m]
+            if len(i) == 0 or self.offsets[m + 1] - self.offsets[m] < 2:
+                matches.append((np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)))
+                continue
+            index, angle = matcher.top2(d[i], self.descriptors[self.offsets[m]:self.offsets[m + 1]])
+            ok = angle[:, 0] < ratio * angle[:, 1]
+            matches.append((i[ok], index[ok, 0], angle[ok, 0].astype(np.float64)))
+        return matches
+
+
+def recall(index, descriptors, ratio=matcher.RATIO, k=NEIGHBOURS):
+    """
+    Fraction of the matches of the exact matcher (matcher.match_descriptors
+    against every gallery image) that index.match also finds, and the
+    fraction of the index matches that the exact matcher agrees with.
+    """
+    approx = index.match(descriptors, ratio, k)
+    nExact = nApprox = nBoth = 0
+    for m, (i, j, angle) in enumerate(approx):
+        exact = matcher.match_descriptors(descriptors, index.descriptors[index.offsets[m]:index.offsets[m + 1]], ratio)
+        exactPairs = set(zip(exact[0], exact[1]))
+        nExact += len(exactPairs)
+        nApprox += len(i)
+        nBoth += len(exactPairs & set(zip(i, j)))
+    return nBoth / float(max(nExact, 1)), nBoth / float(max(nApprox, 1))
+
+
+def benchmark(query='library', images=('basmati', 'book', 'box', 'scene', 'library2'), copies=20):
+    """
+    Match query against a gallery of the images plus copies of each with
+    the 4 x 4 cells of their descriptors shuffled, which have the
+    statistics of SIFT descriptors but match nothing.
+    """
+    rng = np.random.RandomState(0)
+    gallery, names = [], []
+    for name in images:
+        d = keyfile.load_keys(name + '.key')[1]
+        gallery.append(d)
+        names.append(name)
+        for c in range(copies - 1):
+            gallery.append(d.reshape(-1, 16, 8)[:, rng.permutation(16)].reshape(-1, 128))
+            names.append('%s-shuffled%d' % (name, c))
+    q = keyfile.load_keys(query + '.key')[1]
+
+    start = time.time()
+    index = DescriptorIndex(gallery, names)
+    print("Index of %d images, %d descriptors built in %.2f s" % (len(gallery), len(index), time.time() - start))
+    start = time.time()
+    for d in gallery:
+        matcher.match_descriptors(q, d)
+    print("Exact matching: %.2f s" % (time.time() - start))
+    for checks, eps in ((16, 3.0), (16, 1.0)):
+        index.checks, index.eps = checks, eps
+        start = time.time()
+        index.match(q)
+        seconds = time.time() - start
+        print("checks=%d eps=%.1f: %.2f s, recall %.3f, precision %.3f" % ((checks, eps, seconds) + recall(index, q)))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,240 @@
+"""
+Vectorized RANSAC for SIFT matches.
+
+Every match between keypoints (row, col, scale, orientation) implies a
+change of scale and orientation from the first image to the second. A
+hypothesis is the change of one match, and its consensus set is every
+match whose change agrees with it within SCALE_T (relative) and
+ORIENTATION_T (degrees). Consensus sets are computed for a batch of
+hypotheses at once as a matches x hypotheses array, and hypotheses are
+drawn until the chance of never having drawn an inlier drops below
+1 - CONFIDENCE, given the best inlier ratio found so far.
+
+Optionally the best consensus set is then verified geometrically, by a
+second RANSAC of similarity or affine transforms fitted to minimal samples
+of it: the inliers become all matches that the best transform maps within
+TOLERANCE pixels, and the transform is refitted to them by least squares.
+"""
+import math
+import time
+import numpy as np
+
+# defaults for ransac
+SCALE_T = 0.55
+ORIENTATION_T = 50
+CONFIDENCE = 0.99
+MAX_ITERATIONS = 1000
+BATCH = 32
+TOLERANCE = 10.0
+MODELS = ('similarity', 'affine')
+
+
+def changes(keypoints1, keypoints2):
+    # change of scale (a ratio) and orientation of every match
+    k1 = np.asarray(keypoints1, dtype=np.float64).reshape(-1, 4)
+    k2 = np.asarray(keypoints2, dtype=np.float64).reshape(-1, 4)
+    return k2[:, 2] / k1[:, 2], k2[:, 3] - k1[:, 3]
+
+
+def angular_distance(o1, o2):
+    # smallest angle between orientations, element-wise
+    phi = np.abs(o2 - o1) % (2 * math.pi)
+    return np.minimum(phi, 2 * math.pi - phi)
+
+
+def consistent(scale, orientation, hypotheses, scale_t=SCALE_T, orientation_t=ORIENTATION_T):
+    """
+    matches x hypotheses array, true where the change of a match agrees
+    with the change of the match of a hypothesis (indices into scale and
+    orientation).
+    """
+    ratio = scale[:, np.newaxis] / scale[hypotheses]
+    return ((np.abs(ratio - 1) <= scale_t) &
+            (angular_distance(orientation[:, np.newaxis], orientation[hypotheses]) <= math.radians(orientation_t)))
+
+
+def required_iterations(inlierRatio, sampleSize=1, confidence=CONFIDENCE):
+    # hypotheses needed to draw an all-inlier sample with the given confidence
+    good = inlierRatio ** sampleSize
+    if good >= 1:
+        return 1
+    if good <= 0:
+        return float('inf')
+    return int(math.ceil(math.log(1 - confidence) / math.log(1 - good)))
+
+
+def fit_transform(points1, points2, model='similarity'):
+    """
+    Least squares 2 x 3 transform taking (x, y) points1 to points2, either
+    a similarity (rotation, uniform scale and translation) or an affine
+    transform.
+    """
+    assert model in MODELS, "Unknown transform model %r" % (model,)
+    x, y = points1[:, 0], points1[:, 1]
+    one, zero = np.ones_like(x), np.zeros_like(x)
+    if model == 'similarity':
+        # [a -b tx; b a ty]
+        A = np.concatenate((np.column_stack((x, -y, one, zero)), np.column_stack((y, x, zero, one))))
+        a, b, tx, ty = np.linalg.lstsq(A, np.concatenate((points2[:, 0], points2[:, 1])), rcond=None)[0]
+        return np.array([[a, -b, tx], [b, a, ty]])
+    A = np.column_stack((x, y, one))
+    return np.linalg.lstsq(A, points2, rcond=None)[0].T
+
+
+def apply_transform(T, points):
+    return np.dot(points, T[:, :2].T) + T[:, 2]
+
+
+def sample_transforms(points1, points2, samples, model='similarity'):
+    """
+    H x 2 x 3 transforms fitted exactly to H minimal samples (H x 2 point
+    indices for a similarity, H x 3 for an affine transform). Degenerate
+    samples give NaN transforms.
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if model == 'similarity':
+            # as complex numbers, w = s z + t
+            z = points1[:, 0] + 1j * points1[:, 1]
+            w = points2[:, 0] + 1j * points2[:, 1]
+            a, b = samples[:, 0], samples[:, 1]
+            sc = (w[a] - w[b]) / (z[a] - z[b])
+            t = w[a] - sc * z[a]
+            return np.stack((np.column_stack((sc.real, -sc.imag, t.real)),
+                             np.column_stack((sc.imag, sc.real, t.imag))), axis=1)
+        A = np.concatenate((points1[samples], np.ones(samples.shape + (1,))), axis=2)
+        return np.transpose(np.matmul(np.linalg.pinv(A), points2[samples]), (0, 2, 1))
+
+
+def verify(keypoints1, keypoints2, inliers, model='similarity', tolerance=TOLERANCE, confidence=CONFIDENCE,
+           maxIterations=MAX_ITERATIONS, rounds=3, rng=np.random):
+    """
+    Geometric verification of a consensus set. Transforms are fitted to
+    random minimal samples of the consensus set (in batches, adaptively as
+    in ransac), and the one that maps the most matches within tolerance
+    pixels is refined by least squares on those matches a few times.
+    Returns the new inlier mask and the transform (None if there were too
+    few inliers to fit one).
+    """
+    assert model in MODELS, "Unknown transform model %r" % (model,)
+    # (x, y) = (col, row) of the keypoints
+    p1 = np.asarray(keypoints1, dtype=np.float64).reshape(-1, 4)[:, 1::-1]
+    p2 = np.asarray(keypoints2, dtype=np.float64).reshape(-1, 4)[:, 1::-1]
+    sampleSize = 2 if model == 'similarity' else 3
+    candidates = np.nonzero(inliers)[0]
+    if len(candidates) < sampleSize:
+        return np.zeros(len(p1), dtype=bool), None
+
+    best, bestCount = inliers, 0
+    needed, tried = maxIterations, 0
+    while tried < needed:
+        h = min(BATCH, needed - tried)
+        samples = np.array([rng.choice(candidates, sampleSize, replace=False) for _ in range(h)])
+        T = sample_transforms(p1, p2, samples, model)
+        # H x M distances of every match under every transform
+        mapped = np.einsum('mk,hjk->hmj', p1, T[:, :, :2]) + T[:, np.newaxis, :, 2]
+        with np.errstate(invalid='ignore'):
+            agree = np.sqrt(np.sum((mapped - p2) ** 2, axis=2)) <= tolerance
+        counts = np.sum(agree, axis=1)
+        k = np.argmax(counts)
+        if counts[k] > bestCount:
+            bestCount = counts[k]
+            best = agree[k]
+            ratio = np.count_nonzero(best[candidates]) / float(len(candidates))
+            needed = min(maxIterations, required_iterations(ratio, sampleSize, confidence))
+        tried += h
+
+    T = None
+    for _ in range(rounds):
+        if np.count_nonzero(best) < sampleSize:
+            break
+        T = fit_transform(p1[best], p2[best], model)
+        new = np.sqrt(np.sum((apply_transform(T, p1) - p2) ** 2, axis=1)) <= tolerance
+        if np.array_equal(new, best) or np.count_nonzero(new) < sampleSize:
+            break
+        best = new
+    return best, T
+
+
+def ransac(keypoints1, keypoints2, scale_t=SCALE_T, orientation_t=ORIENTATION_T, confidence=CONFIDENCE,
+           maxIterations=MAX_ITERATIONS, model=None, tolerance=TOLERANCE, rng=np.random):
+    """
+    RANSAC over matches, keypoints1[m] matching keypoints2[m].
+
+    Output:
+    ----------------
+    inliers     Boolean mask of the matches in the best consensus set (or
+                of the verified matches when model is given).
+
+    T           The fitted 2 x 3 transform from (x, y) in the first image
+                to the second, None without a model.
+
+    iterations  Number of hypotheses tried.
+    """
+    scale, orientation = changes(keypoints1, keypoints2)
+    n = len(scale)
+    best = np.zeros(n, dtype=bool)
+    if n == 0:
+        return best, None, 0
+
+    # hypotheses without replacement: at most every match once
+    order = rng.permutation(n)
+    bestCount = 0
+    needed = min(maxIterations, n)
+    tried = 0
+    while tried < needed:
+        hypotheses = order[tried:min(tried + BATCH, needed)]
+        agree = consistent(scale, orientation, hypotheses, scale_t, orientation_t)
+        counts = np.sum(agree, axis=0)
+        k = np.argmax(counts)
+        if counts[k] > bestCount:
+            bestCount = counts[k]
+            best = agree[:, k]
+            needed = min(maxIterations, n, required_iterations(bestCount / float(n), 1, confidence))
+        tried += len(hypotheses)
+
+    T = None
+    if model is not None:
+        best, T = verify(keypoints1, keypoints2, best, model, tolerance, confidence, maxIterations, rng=rng)
+    return best, T, tried
+
+
+def ransac_loop(keypoints1, keypoints2, repeat=10, orientation_t=ORIENTATION_T, scale_t=SCALE_T, rng=np.random):
+    # the double loop of the original SIFTmatch.ransac, to time against
+    n = len(keypoints1)
+    best = []
+    for _ in range(repeat):
+        r = rng.randint(n)
+        scale = keypoints2[r][2] / keypoints1[r][2]
+        orientation = keypoints2[r][3] - keypoints1[r][3]
+        current = []
+        for m in range(n):
+            if abs(keypoints2[m][2] / keypoints1[m][2] / scale - 1) > scale_t:
+                continue
+            if angular_distance(orientation, keypoints2[m][3] - keypoints1[m][3]) > math.radians(orientation_t):
+                continue
+            current.append(m)
+        if len(current) > len(best):
+            best = current
+    return best
+
+
+def benchmark(image1='library', image2='library2'):
+    import keyfile
+    import matcher
+    keypoints1, descriptors1 = keyfile.load_keys(image1 + '.key')
+    keypoints2, descriptors2 = keyfile.load_keys(image2 + '.key')
+    i, j, angle = matcher.match_descriptors(descriptors1, descriptors2)
+    k1, k2 = keypoints1[i], keypoints2[j]
+
+    start = time.time()
+    best = ransac_loop(k1, k2, rng=np.random.RandomState(0))
+    print("Loop, 10 repeats: %d of %d matches in %.2f ms" % (len(best), len(i), 1000 * (time.time() - start)))
+    for model in (None,) + MODELS:
+        start = time.time()
+        inliers, T, iterations = ransac(k1, k2, model=model, rng=np.random.RandomState(0))
+        print("Vectorized, %s: %d of %d matches, %d hypotheses in %.2f ms" % (
+            model or 'consensus only', np.count_nonzero(inliers), len(i), iterations, 1000 * (time.time() - start)))
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,111 @@
+"""
+Fast loading of SIFT keypoint files (.key).
+
+A .key file starts with a "count 128" header line followed, for every
+keypoint, by its row, column, scale and orientation and its 128 descriptor
+values. The whole file is split and converted in one go into a count x
+132 float32 array, and the descriptors are normalized to unit length
+together instead of one at a time.
+
+The parsed array is cached next to the key file as image.key.npy, with the
+modification time of the key file. It is reused while the key file keeps
+that modification time, memory mapped, so loading a gallery mostly reads
+the cache files.
+"""
+import os
+import time
+import numpy as np
+
+CACHE_SUFFIX = '.npy'
+
+
+def parse_keys(path):
+    """
+    Parse a .key file into a count x 132 float32 array: the keypoint (row,
+    column, scale, orientation) then its unit length descriptor.
+    """
+    with open(path) as f:
+        values = f.read().split()
+    assert len(values) >= 2, "Invalid keypoint file header."
+    count, length = int(values[0]), int(values[1])
+    assert length == 128, "Invalid keypoint descriptor length in header (should be 128)."
+    assert len(values) - 2 == count * 132, "Incorrect total number of keypoints read."
+    keys = np.array(values[2:], dtype=np.float32).reshape(count, 132)
+    # normalize the descriptors to unit length
+    norm = np.sqrt(np.sum(np.square(keys[:, 4:], dtype=np.float64), axis=1))
+    keys[:, 4:] /= np.maximum(norm, np.finfo(np.float32).tiny)[:, np.newaxis]
+    return keys
+
+
+def cache_path(path):
+    return path + CACHE_SUFFIX
+
+
+def mtime(path):
+    # modification time, in nanoseconds where available so that the cache
+    # can be given exactly the key file's
+    st = os.stat(path)
+    return getattr(st, 'st_mtime_ns', st.st_mtime)
+
+
+def load_keys(path, cache=True, mmap=True):
+    """
+    Keypoints and descriptors of a .key file, as count x 4 and count x 128
+    float32 arrays (read-only views of the cache when it is memory mapped).
+    The cache is (re)written when it is missing or its modification time
+    differs from the key file's; cache=False parses the file regardless.
+    """
+    if cache:
+        keys = read_cache(path, mmap)
+        if keys is None:
+            keys = parse_keys(path)
+            write_cache(path, keys)
+    else:
+        keys = parse_keys(path)
+    return keys[:, :4], keys[:, 4:]
+
+
+def read_cache(path, mmap=True):
+    # the cached array of path, or None when there is no up to date cache
+    cached = cache_path(path)
+    try:
+        if mtime(cached) != mtime(path):
+            return None
+        keys = np.load(cached, mmap_mode='r' if mmap else None)
+    except (IOError, OSError, ValueError):
+        return None
+    return keys if keys.ndim == 2 and keys.shape[1] == 132 else None
+
+
+def write_cache(path, keys):
+    # written to a temporary file and renamed, so readers never see half a
+    # cache; a read-only gallery directory simply goes without one
+    cached = cache_path(path)
+    temp = '%s.%d.tmp%s' % (cached, os.getpid(), CACHE_SUFFIX)
+    try:
+        np.save(temp, keys)
+        t = mtime(path)
+        if isinstance(t, float):
+            os.utime(temp, (t, t))
+        else:
+            os.utime(temp, ns=(t, t))
+        getattr(os, 'replace', os.rename)(temp, cached)
+    except (IOError, OSError):
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def benchmark(images=('basmati', 'book', 'box', 'scene', 'library', 'library2')):
+    for name in images:
+        start = time.time()
+        parse_keys(name + '.key')
+        parsed = time.time() - start
+        load_keys(name + '.key')
+        start = time.time()
+        keypoints, descriptors = load_keys(name + '.key')
+        print("%-10s %5d keypoints: parsed in %.1f ms, from the cache in %.2f ms" % (
+            name, len(keypoints), 1000 * parsed, 1000 * (time.time() - start)))
+
+
+if __name__ == '__main__':
+    benchmark()
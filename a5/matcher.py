@@ -0,0 +1,114 @@
+"""
+Vectorized SIFT descriptor matching with the ratio test.
+
+The descriptors are unit length, so the angle between two of them is
+arccos of their dot product, and the best matches are the largest dot
+products. The similarities of a block of query descriptors against all of
+the other image are one matrix multiply; argpartition picks the top two
+of every row without sorting it, and the ratio test is applied to the
+whole block at once. Blocks of CHUNK rows bound the memory to
+CHUNK x len(descriptors2) similarities.
+"""
+import math
+import time
+import numpy as np
+
+# defaults for match_descriptors
+RATIO = 0.68
+CHUNK = 1024
+
+
+def as_matrix(descriptors, dtype=np.float64):
+    # N x 128 array from a list of descriptors (or an array already)
+    descriptors = np.asarray(descriptors, dtype=dtype)
+    return descriptors.reshape(-1, descriptors.shape[-1]) if descriptors.size else descriptors.reshape(0, 128)
+
+
+def top2(descriptors1, descriptors2, chunk=CHUNK):
+    """
+    For every descriptor of descriptors1, the indices in descriptors2 of its
+    nearest and second nearest descriptor and the angles to them, as
+    N x 2 arrays (nearest first). descriptors2 needs at least 2 rows.
+    """
+    d1 = as_matrix(descriptors1)
+    d2 = as_matrix(descriptors2, d1.dtype)
+    assert len(d2) >= 2, "Need at least two descriptors to match against"
+    n = len(d1)
+    index = np.empty((n, 2), dtype=np.intp)
+    angle = np.empty((n, 2), dtype=d1.dtype)
+    d2t = np.ascontiguousarray(d2.T)
+    for start in range(0, n, chunk):
+        sim = np.dot(d1[start:start + chunk], d2t)
+        # the two largest dot products of every row, in no particular order
+        best = np.argpartition(sim, -2, axis=1)[:, -2:]
+        bestSim = np.take_along_axis(sim, best, axis=1)
+        swap = bestSim[:, 1] > bestSim[:, 0]
+        best[swap] = best[swap, ::-1]
+        bestSim[swap] = bestSim[swap, ::-1]
+        index[start:start + chunk] = best
+        # rounding can push the dot product of unit vectors just past 1
+        angle[start:start + chunk] = np.arccos(np.clip(bestSim, -1.0, 1.0))
+    return index, angle
+
+
+def match_descriptors(descriptors1, descriptors2, ratio=RATIO, chunk=CHUNK):
+    """
+    Match every descriptor of descriptors1 to its nearest descriptor in
+    descriptors2, keeping only the matches whose angle is less than ratio
+    times the angle to the second nearest.
+
+    Output:
+    ----------------
+    i, j        Indices of the matched descriptors in descriptors1 and
+                descriptors2, in the order of descriptors1.
+
+    angle       The angle of every match.
+    """
+    if len(descriptors1) == 0 or len(descriptors2) < 2:
+        return np.zeros(0, dtype=np.intp), np.zeros(0, dtype=np.intp), np.zeros(0)
+    index, angle = top2(descriptors1, descriptors2, chunk)
+    # angle[:, 0] < ratio * angle[:, 1], which is also false for ties
+    keep = np.nonzero(angle[:, 0] < ratio * angle[:, 1])[0]
+    return keep, index[keep, 0], angle[keep, 0]
+
+
+def match_descriptors_loop(descriptors1, descriptors2, ratio=RATIO):
+    # the original double loop of SIFTmatch.match, to check against. The
+    # angles are kept in a dict, so equal angles overwrite each other
+    matched = []
+    for i in range(len(descriptors1)):
+        matches = {}
+        for j in range(len(descriptors2)):
+            matches[math.acos(min(1.0, np.dot(descriptors1[i], descriptors2[j])))] = (i, j)
+        sorted_m = sorted(matches)
+        if sorted_m[0] / sorted_m[1] < ratio:
+            matched.append(matches[sorted_m[0]])
+    return matched
+
+
+def random_descriptors(n, seed=0):
+    # n unit length, non-negative descriptors, like those of SIFT
+    d = np.random.RandomState(seed).rand(n, 128) ** 4
+    return d / np.sqrt(np.sum(d ** 2, axis=1))[:, np.newaxis]
+
+
+def check(n1=300, n2=400):
+    # the vectorized matcher finds the same matches as the double loop
+    d1 = random_descriptors(n1, 1)
+    d2 = np.concatenate((random_descriptors(n2, 2), d1[:n1 // 3] + 0.01))
+    d2 /= np.sqrt(np.sum(d2 ** 2, axis=1))[:, np.newaxis]
+    i, j, angle = match_descriptors(d1, d2)
+    assert list(zip(i, j)) == match_descriptors_loop(d1, d2), "Vectorized matches differ from the loop"
+    print("match_descriptors agrees with the loop on %d matches" % len(i))
+
+
+def benchmark(n=2000):
+    d1, d2 = random_descriptors(n, 1), random_descriptors(n, 2)
+    start = time.time()
+    i, j, angle = match_descriptors(d1, d2)
+    print("%d x %d descriptors: %.1f ms, %d matches" % (n, n, 1000 * (time.time() - start), len(i)))
+
+
+if __name__ == '__main__':
+    check()
+    benchmark()
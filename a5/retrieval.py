@@ -0,0 +1,126 @@
+"""
+Rank a gallery of images by how well they match a query image.
+
+    python retrieval.py [query] [workers]
+
+Every image with both a .pgm and a .key file in the gallery directory is
+matched against the query (matcher.match_descriptors), the matches are
+verified with consensus.ransac, and the images are ranked by their number
+of verified inliers.
+
+Descriptors are loaded once: the parent process parses every key file
+into its keyfile cache before starting the pool, and the workers memory
+map those caches, so they share the same pages instead of each parsing
+the files. The query descriptors are handed to every worker once, by the
+pool initializer.
+"""
+import multiprocessing
+import os
+import sys
+import time
+import numpy as np
+import keyfile
+import matcher
+import consensus
+
+# defaults for retrieve
+MODEL = 'similarity'
+
+_query = None
+
+
+def gallery_images(directory='.'):
+    # names of the images with both a .pgm and a .key file, sorted
+    names = []
+    for f in sorted(os.listdir(directory)):
+        name, ext = os.path.splitext(f)
+        if ext == '.key' and os.path.isfile(os.path.join(directory, name + '.pgm')):
+            names.append(os.path.join(directory, name) if directory != '.' else name)
+    return names
+
+
+def _init_worker(keypoints, descriptors):
+    global _query
+    _query = (keypoints, descriptors)
+
+
+def score_image(job):
+    """
+    Match the query (set by _init_worker) against one (index, name, ratio,
+    model, seed) gallery job. Returns a dict with the image name, its number
+    of matches and verified inliers, and the seconds spent per stage.
+    """
+    index, name, ratio, model, seed = job
+    keypoints1, descriptors1 = _query
+    start = time.time()
+    keypoints2, descriptors2 = keyfile.load_keys(name + '.key')
+    loaded = time.time()
+    i, j, angle = matcher.match_descriptors(descriptors1, descriptors2, ratio)
+    matched = time.time()
+    inliers, T, iterations = consensus.ransac(keypoints1[i], keypoints2[j], model=model,
+                                              rng=np.random.RandomState(seed + index))
+    verified = time.time()
+    return dict(index=index, name=name, keypoints=len(keypoints2), matches=len(i),
+                inliers=int(np.count_nonzero(inliers)), transform=T,
+                load=loaded - start, match=matched - loaded, ransac=verified - matched)
+
+
+def retrieve(query, gallery=None, workers=None, ratio=matcher.RATIO, model=MODEL, seed=0):
+    """
+    Rank the gallery images (names without extension, default: every image
+    in the directory of the query but the query) by verified inliers with
+    the query. workers=1 runs in this process, None uses one per core.
+
+    Output:
+    ----------------
+    ranked      One dict per gallery image (see score_image), most inliers
+                first, ties by most matches then name.
+
+    timings     Seconds per stage: 'load' (query and gallery caches),
+                'match' and 'ransac' (summed over the images, so more than
+                'total' with several workers) and 'total' (wall clock).
+    """
+    start = time.time()
+    if gallery is None:
+        gallery = [name for name in gallery_images(os.path.dirname(query) or '.') if name != query]
+
+    # parse (or validate the caches of) every key file once, up front
+    keypoints, descriptors = keyfile.load_keys(query + '.key', mmap=False)
+    for name in gallery:
+        keyfile.load_keys(name + '.key')
+    loaded = time.time()
+
+    jobs = [(k, name, ratio, model, seed) for k, name in enumerate(gallery)]
+    if workers == 1:
+        _init_worker(keypoints, descriptors)
+        results = [score_image(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(workers, _init_worker, (keypoints, descriptors))
+        try:
+            results = pool.map(score_image, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    ranked = sorted(results, key=lambda r: (-r['inliers'], -r['matches'], r['name']))
+    timings = dict(load=loaded - start + sum(r['load'] for r in results),
+                   match=sum(r['match'] for r in results),
+                   ransac=sum(r['ransac'] for r in results),
+                   total=time.time() - start)
+    return ranked, timings
+
+
+def print_ranking(query, ranked, timings):
+    print("Query: %s" % query)
+    print("%4s  %-12s %9s %8s %8s" % ('rank', 'image', 'keypoints', 'matches', 'inliers'))
+    for rank, r in enumerate(ranked):
+        print("%4d  %-12s %9d %8d %8d" % (rank + 1, r['name'], r['keypoints'], r['matches'], r['inliers']))
+    print("Load %.1f ms, match %.1f ms, ransac %.1f ms, total %.1f ms" % tuple(
+        1000 * timings[k] for k in ('load', 'match', 'ransac', 'total')))
+
+
+if __name__ == '__main__':
+    query = sys.argv[1] if len(sys.argv) > 1 else 'library'
+    workers = int(sys.argv[2]) if len(sys.argv) > 2 else None
+    ranked, timings = retrieve(query, workers=workers)
+    print_ranking(query, ranked, timings)
@@ -1,45 +1,23 @@
+from __future__ import print_function
 from PIL import Image, ImageDraw
 import matplotlib.pyplot as plt
 import numpy as np
 import math
 from scipy import signal
 import numpy.linalg as lin
+import convolve
+import tracker
+import framesource
 
-# START OF FUNCTIONS CARRIED FORWARD FROM ASSIGNMENT 2
-
-def boxfilter(n):
-    assert n%2 is not 0, "Dimension must be odd"
-    return np.full((n,n),1.0/(n*n), dtype = float)
-
-def gauss1d(sigma):
-    # generate n, ensure n is odd
-    n = np.ceil(6*sigma)
-    n = n+1 if n%2 == 0 else n
-
-    i = np.arange(-np.floor(n/2),np.floor(n/2)+1,1) # generate the range
-    gauss = np.vectorize(lambda x: np.exp((-x**2)/(2*sigma**2))) # mapping function
-    i = gauss(i) # apply the map
-    return 1/sum(i)*i # return normalized
-
-def gauss2d(sigma):
-    i = gauss1d(sigma) # generate 1d guass
-    i = i[np.newaxis] # generate 2d 
-    i_t = np.transpose(i) # create transpose
-
-    return signal.convolve2d(i, i_t) # convolve i with i'
-
-def gaussconvolve2d(image, sigma):
-    f = gauss2d(sigma) # generate 2d filter
-    return signal.convolve2d(image,f,'same') # convolve with 2d filter of same size
-
-# END OF FUNCTIONS CARRIED FORWARD FROM ASSIGNMENT 2
+# FUNCTIONS CARRIED FORWARD FROM ASSIGNMENT 2 (kernels are cached, see filters.py)
+from filters import boxfilter, gauss1d, gauss2d, gaussconvolve2d
 
 # Define a function, boxconvolve2d, to convolve an image with a boxfilter of size n
 # (used in Estimate_Derivatives below).
 
 def boxconvolve2d(image, n):
     f = boxfilter(n) # generate boxfilter
-    return signal.convolve2d(image,f,'same')
+    return convolve.convolve2d(image,f) # boxfilter is separable, engine detects it
 
 def Estimate_Derivatives(im1, im2, sigma=1.5, n=3): # Estimate spatial derivatives of im1 and temporal derivative from im1 to im2.
     im1_smoothed = gaussconvolve2d(im1,sigma) # Smooth im1 with a 2D Gaussian of the given sigma.
@@ -47,10 +25,13 @@ def Estimate_Derivatives(im1, im2, sigma=1.5, n=3): # Estimate spatial derivativ
     It = boxconvolve2d(im2, n) - boxconvolve2d(im1, n) # Use point-wise difference between (boxfiltered) im2 and im1 to estimate temporal derivative
     return Ix, Iy, It
 
-def Optical_Flow(im1, im2, x, y, window_size, sigma=1.5, n=3):
+def Optical_Flow(im1, im2, x, y, window_size, sigma=1.5, n=3, derivatives=None):
     assert((window_size % 2) == 1) , "Window size must be odd"
-    # UNCOMMENT THE NEXT LINE WHEN YOU HAVE COMPLETED Estimate_Derivatives
-    Ix, Iy, It = Estimate_Derivatives(im1, im2, sigma, n)
+    # derivatives = Estimate_Derivatives(im1, im2, sigma, n) can be passed in
+    # to track several points of a frame pair (or see lucaskanade.dense_flow)
+    if derivatives is None:
+        derivatives = Estimate_Derivatives(im1, im2, sigma, n)
+    Ix, Iy, It = derivatives
     half = np.floor(window_size/2)
     # select the three local windows of interest
     win_Ix = Ix[int(y-half-1):int(y+half), int(x-half-1):int(x+half)].T # select window Ix
@@ -91,16 +72,19 @@ def DisplayFlow(im1, im2, x, y, uarr, varr):
     xinit = x+uarr[0]
     yinit = y+varr[0]
     for u,v,ind in zip(uarr[1:], varr[1:], range(1, len(uarr))):
-		draw.line((offset+xinit, yinit, offset+xinit+u, yinit+v),fill="red",width=2)
-		xinit += u
-		yinit += v
+        draw.line((offset+xinit, yinit, offset+xinit+u, yinit+v),fill="red",width=2)
+        xinit += u
+        yinit += v
     draw.line((x, y, offset+xinit, yinit), fill="yellow", width=2)
     im3.show()
     del draw
     return im3
 
 def HitContinue(Prompt='Hit any key to continue'):
-    raw_input(Prompt)
+    try:
+        raw_input(Prompt) # Python 2
+    except NameError:
+        input(Prompt)
 
 # uncomment the next two lines if the leftmost digit of your student number is 8
 x=274
@@ -119,59 +103,67 @@ sigma=1.5
 # size of the boxfilter (used in the estimation of It)
 n = 3
 
-##############################################################################
-#             basic testing (optical flow from frame 7 to 8 only)            #
-##############################################################################
-
-# scale factor for display of optical flow (to make result more visible)
-scale=10
-
-PIL_im1 = Image.open('frame07.png')
-PIL_im2 = Image.open('frame08.png')
-im1 = np.asarray(PIL_im1)
-im2 = np.asarray(PIL_im2)
-dx, dy = Optical_Flow(im1, im2, x, y, window_size, sigma, n)
-print 'Optical flow: [', dx, ',', dy, ']'
-plt.imshow(im1, cmap='gray')
-plt.hold(True)
-plt.plot(x,y,'xr')
-plt.plot(x+dx*scale,y+dy*scale, 'dy')
-print 'Close figure window to continue...'
-plt.show()
-uarr = [dx]
-varr = [dy]
-
-##############################################################################
-#                   run the remainder of the image sequence                  #
-##############################################################################
-
-# UNCOMMENT THE CODE THAT FOLLOWS (ONCE BASIC TESTING IS COMPLETE/DEBUGGED)
-
-print 'frame 7 to 8'
-DisplayFlow(PIL_im1, PIL_im2, x, y, uarr, varr)
-HitContinue()
-
-prev_im = im2
-xcurr = x+dx
-ycurr = y+dy
-offset = PIL_im1.size[0]
-
-for i in range(8, 14):
-    im_i = 'frame%0.2d.png'%(i+1)
-    print 'frame', i, 'to', (i+1)
-    PIL_im_i = Image.open('%s'%im_i)
-    numpy_im_i = np.asarray(PIL_im_i)
-    dx, dy = Optical_Flow(prev_im, numpy_im_i, xcurr, ycurr, window_size, sigma, n)
-    xcurr += dx
-    ycurr += dy
-    prev_im = numpy_im_i
-    uarr.append(dx)
-    varr.append(dy)
-    # redraw the (growing) figure
-    DisplayFlow(PIL_im1, PIL_im_i, x, y, uarr, varr)
+if __name__ == '__main__': # lucaskanade.py imports this module
+    ##############################################################################
+    #             basic testing (optical flow from frame 7 to 8 only)            #
+    ##############################################################################
+
+    # scale factor for display of optical flow (to make result more visible)
+    scale=10
+
+    PIL_im1 = Image.open('frame07.png')
+    PIL_im2 = Image.open('frame08.png')
+    im1 = np.asarray(PIL_im1)
+    im2 = np.asarray(PIL_im2)
+    # the tracker keeps each frame's derivatives, so every frame is filtered
+    # once (frame i is the first frame of pair i -> i+1 too); minEigenvalue=0
+    # follows the point however weak its texture, as Optical_Flow does
+    klt = tracker.Tracker([(x, y)], window_size, sigma, n, minEigenvalue=0)
+    dxs, dys = klt.step(7, im1, 8, im2)
+    dx, dy = dxs[0], dys[0]
+    print('Optical flow: [', dx, ',', dy, ']')
+    plt.imshow(im1, cmap='gray')
+    plt.hold(True)
+    plt.plot(x,y,'xr')
+    plt.plot(x+dx*scale,y+dy*scale, 'dy')
+    print('Close figure window to continue...')
+    plt.show()
+    uarr = [dx]
+    varr = [dy]
+
+    ##############################################################################
+    #                   run the remainder of the image sequence                  #
+    ##############################################################################
+
+    # UNCOMMENT THE CODE THAT FOLLOWS (ONCE BASIC TESTING IS COMPLETE/DEBUGGED)
+
+    print('frame 7 to 8')
+    DisplayFlow(PIL_im1, PIL_im2, x, y, uarr, varr)
     HitContinue()
 
-##############################################################################
-# Don't forget to include code to document the sequence of (x, y) positions  #
-# of your feature in each frame successfully tracked.                        #
-##############################################################################
+    prev_im = im2
+    offset = PIL_im1.size[0]
+
+    # frames 9 to 14 are decoded on a background thread while we track
+    for k, numpy_im_i in framesource.FrameSource(framesource.frame_paths('frame%02d.png', 9, 15)):
+        i = k + 8
+        print('frame', i, 'to', (i+1))
+        PIL_im_i = Image.fromarray(numpy_im_i)
+        dxs, dys = klt.step(i, prev_im, i+1, numpy_im_i)
+        if not klt.active[0]:
+            print('point lost (its window left the image)')
+            break
+        dx, dy = dxs[0], dys[0]
+        prev_im = numpy_im_i
+        uarr.append(dx)
+        varr.append(dy)
+        # redraw the (growing) figure
+        DisplayFlow(PIL_im1, PIL_im_i, x, y, uarr, varr)
+        HitContinue()
+
+    ##############################################################################
+    # Don't forget to include code to document the sequence of (x, y) positions  #
+    # of your feature in each frame successfully tracked.                        #
+    ##############################################################################
+    for frame, positions in zip(range(7, 15), klt.history):
+        print('frame %02d: (%.2f, %.2f)' % ((frame,) + tuple(positions[0])))
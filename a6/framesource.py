@@ -0,0 +1,140 @@
+"""
+Streaming frame source for image sequences.
+
+FrameSource decodes the frames of a sequence on a background thread, at
+most `prefetch` frames ahead of the consumer, so decoding overlaps with
+the work done on each frame and memory stays bounded however long the
+sequence is. Frames can be converted (e.g. to grayscale 'L') while they
+are decoded. RingBuffer keeps the last few frames in preallocated memory,
+for algorithms that look back a fixed number of frames.
+
+    for i, frame in FrameSource(frame_paths('frame%02d.png', 7, 15), 'L'):
+        ...
+"""
+import threading
+import numpy as np
+from PIL import Image
+try:
+    import queue
+except ImportError:
+    import Queue as queue # Python 2
+
+# defaults for FrameSource
+PREFETCH = 8
+
+_DONE = object()
+
+
+def frame_paths(pattern, start, stop):
+    # pattern % i for i in start..stop-1, e.g. frame_paths('dwc%03d.png', 1, 152)
+    return [pattern % i for i in range(start, stop)]
+
+
+def read_frame(path, modes=None):
+    """
+    The frame at path as an array, converted to the PIL mode (e.g. 'L' or
+    'RGB'), or a tuple of arrays for a tuple of modes.
+    """
+    im = Image.open(path)
+    if modes is None:
+        return np.asarray(im)
+    if isinstance(modes, str):
+        return np.asarray(im.convert(modes))
+    base = im.convert('RGB')
+    return tuple(np.asarray(base if mode == 'RGB' else base.convert(mode)) for mode in modes)
+
+
+class FrameSource(object):
+    """
+    Iterate over (index, frame) for the frame paths, decoded by read_frame
+    (with modes) on a background thread that stays at most prefetch
+    frames ahead. Errors while reading are raised in the consumer, at the
+    frame that failed. Use as a context manager (or call close) to stop
+    the thread when not reading to the end.
+    """
+
+    def __init__(self, paths, modes=None, prefetch=PREFETCH, reader=read_frame):
+        self.paths = list(paths)
+        self.modes = modes
+        self.reader = reader
+        self._queue = queue.Queue(maxsize=max(1, prefetch))
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self.paths)
+
+    def _put(self, item):
+        # blocks while the queue is full, but gives up once closed
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self):
+        for i, path in enumerate(self.paths):
+            try:
+                item = (i, self.reader(path, self.modes), None)
+            except Exception as e:
+                item = (i, None, e)
+            if not self._put(item) or item[2] is not None:
+                return
+        self._put(_DONE)
+
+    def __iter__(self):
+        assert self._thread is None, "A FrameSource can only be iterated once"
+        self._thread = threading.Thread(target=self._produce)
+        self._thread.daemon = True
+        self._thread.start()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is _DONE:
+                    return
+                i, frame, error = item
+                if error is not None:
+                    raise error
+                yield i, frame
+        finally:
+            self.close()
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RingBuffer(object):
+    """
+    The last `size` frames of a given shape and dtype, in one preallocated
+    array. push copies a frame in, overwriting the oldest; buffer[0] is the
+    newest frame, buffer[1] the one before and so on.
+    """
+
+    def __init__(self, size, shape, dtype=np.uint8):
+        self.frames = np.zeros((size,) + tuple(shape), dtype=dtype)
+        self.count = 0
+
+    def __len__(self):
+        return min(self.count, len(self.frames))
+
+    def push(self, frame):
+        self.frames[self.count % len(self.frames)] = frame
+        self.count += 1
+
+    def __getitem__(self, age):
+        assert 0 <= age < len(self), "Only the last %d frames are kept" % len(self)
+        return self.frames[(self.count - 1 - age) % len(self.frames)]
+
+    def ordered(self):
+        # the kept frames, oldest first
+        return np.stack([self[age] for age in reversed(range(len(self)))])
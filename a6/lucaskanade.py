@@ -0,0 +1,115 @@
+"""
+Dense Lucas-Kanade optical flow.
+
+Optical_Flow solves, for one point, the 2 x 2 least squares system
+
+    [sum Ix*Ix  sum Ix*Iy] V = [sum Ix*It]
+    [sum Ix*Iy  sum Iy*Iy]     [sum Iy*It]
+
+over a window around the point. Here the derivatives of a frame pair are
+estimated once, the five window sums are computed for every pixel at
+once with integral images (so the cost does not depend on the window
+size), and all the 2 x 2 systems are solved in closed form. The solution
+is the pseudo-inverse one, as with np.linalg.pinv in Optical_Flow, and
+the flow is returned in the same form: (dx, dy) = (V[1], V[0]).
+"""
+import time
+import numpy as np
+
+
+def window_sum(a, window_size):
+    """
+    Sum of a over the window_size x window_size window centred on every
+    pixel (zero outside the image), from an integral image.
+    """
+    half = window_size // 2
+    rows, cols = a.shape
+    sat = np.zeros((rows + window_size, cols + window_size))
+    sat[half + 1:half + 1 + rows, half + 1:half + 1 + cols] = a
+    sat = sat.cumsum(axis=0).cumsum(axis=1)
+    return (sat[window_size:, window_size:] - sat[:rows, window_size:]
+            - sat[window_size:, :cols] + sat[:rows, :cols])
+
+
+def structure_tensor(Ix, Iy, It, window_size):
+    # the window sums of Ix*Ix, Ix*Iy, Iy*Iy, Ix*It and Iy*It at every pixel
+    Ix = np.asarray(Ix, dtype=np.float64)
+    Iy = np.asarray(Iy, dtype=np.float64)
+    It = np.asarray(It, dtype=np.float64)
+    return (window_sum(Ix * Ix, window_size), window_sum(Ix * Iy, window_size), window_sum(Iy * Iy, window_size),
+            window_sum(Ix * It, window_size), window_sum(Iy * It, window_size))
+
+
+def solve_flow(Sxx, Sxy, Syy, Sxt, Syt, rcond=1e-15):
+    """
+    Closed form pseudo-inverse solution V of every 2 x 2 system
+    [Sxx Sxy; Sxy Syy] V = [Sxt; Syt]. Where the matrix is singular (rank
+    1, pinv(M) = M / trace(M)^2) or zero, the solution is the minimum norm
+    one, as with np.linalg.pinv. Returns V[0] and V[1].
+    """
+    det = Sxx * Syy - Sxy * Sxy
+    trace = Sxx + Syy
+    regular = det > rcond * trace * trace
+    with np.errstate(divide='ignore', invalid='ignore'):
+        inv = np.where(regular, 1.0 / det, 0.0)
+        rank1 = np.where(~regular & (trace > 0), 1.0 / (trace * trace), 0.0)
+    V0 = np.where(regular, (Syy * Sxt - Sxy * Syt) * inv, (Sxx * Sxt + Sxy * Syt) * rank1)
+    V1 = np.where(regular, (Sxx * Syt - Sxy * Sxt) * inv, (Sxy * Sxt + Syy * Syt) * rank1)
+    return V0, V1
+
+
+def min_eigenvalue(Sxx, Sxy, Syy):
+    # smaller eigenvalue of every structure tensor, a measure of how well
+    # the flow is determined (Shi and Tomasi)
+    return 0.5 * (Sxx + Syy - np.sqrt((Sxx - Syy) ** 2 + 4 * Sxy * Sxy))
+
+
+def dense_flow(Ix, Iy, It, window_size):
+    """
+    Flow at every pixel from the derivatives of a frame pair (see
+    Estimate_Derivatives), with the window centred on the pixel. Returns
+    the rows x cols fields dx and dy.
+
+    Optical_Flow selects the rows y-half-1 .. y+half-1 (and likewise the
+    columns), so its window is centred on (x-1, y-1): Optical_Flow(x, y)
+    is dense_flow(...)[y-1, x-1].
+    """
+    assert((window_size % 2) == 1) , "Window size must be odd"
+    V0, V1 = solve_flow(*structure_tensor(Ix, Iy, It, window_size))
+    return V1, V0
+
+
+def sample(field, x, y):
+    # bilinear sample of a rows x cols field at (x, y) = (col, row)
+    rows, cols = field.shape
+    x = np.clip(np.asarray(x, dtype=np.float64), 0, cols - 1)
+    y = np.clip(np.asarray(y, dtype=np.float64), 0, rows - 1)
+    x0 = np.minimum(np.floor(x).astype(int), cols - 2)
+    y0 = np.minimum(np.floor(y).astype(int), rows - 2)
+    fx, fy = x - x0, y - y0
+    return ((1 - fy) * ((1 - fx) * field[y0, x0] + fx * field[y0, x0 + 1]) +
+            fy * ((1 - fx) * field[y0 + 1, x0] + fx * field[y0 + 1, x0 + 1]))
+
+
+def check(im1, im2, points, window_size=21, sigma=1.5, n=3):
+    # dense_flow agrees with Optical_Flow at the given (x, y) points
+    import OpticalFlow
+    derivatives = OpticalFlow.Estimate_Derivatives(im1, im2, sigma, n)
+    start = time.time()
+    dx, dy = dense_flow(derivatives[0], derivatives[1], derivatives[2], window_size)
+    dense = time.time() - start
+    start = time.time()
+    for x, y in points:
+        u, v = OpticalFlow.Optical_Flow(im1, im2, x, y, window_size, sigma, n, derivatives)
+        assert np.allclose((u, v), (dx[y - 1, x - 1], dy[y - 1, x - 1]), rtol=1e-6, atol=1e-9), \
+            "Dense flow differs from Optical_Flow at (%d, %d)" % (x, y)
+    print("dense_flow agrees with Optical_Flow at %d points; %.1f ms for every pixel, %.1f ms per point" % (
+        len(points), 1000 * dense, 1000 * (time.time() - start) / len(points)))
+
+
+if __name__ == '__main__':
+    from PIL import Image
+    im1 = np.asarray(Image.open('frame07.png'))
+    im2 = np.asarray(Image.open('frame08.png'))
+    rows, cols = im1.shape
+    check(im1, im2, [(x, y) for y in range(20, rows - 20, 40) for x in range(20, cols - 20, 40)])
@@ -0,0 +1,150 @@
+"""
+Pyramidal (coarse-to-fine) Lucas-Kanade with iterative refinement, after
+Bouguet's description of the OpenCV tracker.
+
+Both frames are reduced to a Gaussian pyramid. The flow of every point is
+first estimated on the coarsest level, where a large motion is only a few
+pixels, and every finer level starts from the doubled estimate of the
+level above. On each level the window of the second frame is resampled
+(bilinearly) at the current estimate and the remaining motion is solved
+for, a few times, so the linearization error is refined away instead of
+being the answer. A small window on every level then covers a motion far
+larger than the window itself.
+
+The derivatives on each level are those of Estimate_Derivatives: Ix and
+Iy of the Gaussian smoothed first frame, and It from the box-filtered
+frames (tracker.FrameDerivatives, which also caches them per frame and
+level).
+
+The flow is the motion of the points from im1 to im2, the solution of
+[Ix Iy] V = -It. Optical_Flow solves with +It, so for small motions its
+result is the negative of this one.
+"""
+import time
+import numpy as np
+import lucaskanade
+import tracker
+from filters import gaussconvolve2d
+
+# defaults for pyramid_flow
+LEVELS = 3
+ITERATIONS = 5
+WINDOW_SIZE = 9
+PYRAMID_SIGMA = 1.0
+EPSILON = 0.01
+
+
+def pyramid(image, levels, sigma=PYRAMID_SIGMA):
+    # the image, then levels-1 times smoothed and halved
+    images = [np.asarray(image, dtype=np.float64)]
+    for _ in range(1, levels):
+        images.append(gaussconvolve2d(images[-1], sigma)[::2, ::2])
+    return images
+
+
+def pyramid_flow(im1, im2, points, window_size=WINDOW_SIZE, levels=LEVELS, iterations=ITERATIONS, sigma=1.5, n=3,
+                 minEigenvalue=tracker.MIN_EIGENVALUE, cache=None, keys=(0, 1)):
+    """
+    Flow of the (x, y) points (N x 2) from im1 to im2.
+
+    Inputs:
+    ----------------
+    window_size     Odd window size, the same on every level.
+
+    levels          Pyramid levels, 1 for the full resolution only.
+
+    iterations      Refinement iterations per level (stopping early once
+                    every point moves less than EPSILON).
+
+    sigma, n        As for Estimate_Derivatives.
+
+    minEigenvalue   Points whose smaller structure tensor eigenvalue per
+                    window pixel is below this on any level are lost.
+
+    cache, keys     A tracker.FrameDerivatives and the keys of im1 and im2
+                    in it, to reuse the pyramids of frames tracked before.
+
+    Output:
+    ----------------
+    dx, dy          The flow of every point.
+
+    found           Which points were tracked.
+    """
+    assert((window_size % 2) == 1) , "Window size must be odd"
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if cache is None:
+        cache = tracker.FrameDerivatives(sigma, n, maxsize=2 * levels)
+    pyramid1 = pyramid2 = None
+    half = window_size // 2
+    d = np.arange(-half, half + 1, dtype=np.float64)
+    offX = np.tile(d, window_size)
+    offY = np.repeat(d, window_size)
+
+    guess = np.zeros_like(points)
+    found = np.ones(len(points), dtype=bool)
+    for level in reversed(range(levels)):
+        key1, key2 = (keys[0], level), (keys[1], level)
+        if key1 not in cache or key2 not in cache:
+            if pyramid1 is None:
+                pyramid1, pyramid2 = pyramid(im1, levels), pyramid(im2, levels)
+        # cached levels are looked up by key alone, the pyramids are only
+        # built (and passed) for the levels missing from the cache
+        Ix, Iy, boxed1 = cache.get(key1, pyramid1[level] if key1 not in cache else None)
+        boxed2 = cache.get(key2, pyramid2[level] if key2 not in cache else None)[2]
+        rows, cols = boxed1.shape
+
+        # windows of the first frame, fixed on this level
+        x = points[:, 0:1] / 2 ** level + offX
+        y = points[:, 1:2] / 2 ** level + offY
+        inside = ((x.min(axis=1) >= 0) & (y.min(axis=1) >= 0) &
+                  (x.max(axis=1) <= cols - 1) & (y.max(axis=1) <= rows - 1))
+        # np.gradient: Ix is the derivative along the rows (y), Iy along the columns (x)
+        gy = lucaskanade.sample(Ix, x, y)
+        gx = lucaskanade.sample(Iy, x, y)
+        w1 = lucaskanade.sample(boxed1, x, y)
+        Sxx, Sxy, Syy = np.sum(gx * gx, axis=1), np.sum(gx * gy, axis=1), np.sum(gy * gy, axis=1)
+        found &= inside & (lucaskanade.min_eigenvalue(Sxx, Sxy, Syy) >= minEigenvalue * window_size ** 2)
+
+        motion = np.zeros_like(points)
+        for _ in range(iterations):
+            It = lucaskanade.sample(boxed2, x + guess[:, 0:1] + motion[:, 0:1],
+                                    y + guess[:, 1:2] + motion[:, 1:2]) - w1
+            ex, ey = lucaskanade.solve_flow(Sxx, Sxy, Syy, -np.sum(gx * It, axis=1), -np.sum(gy * It, axis=1))
+            ex[~found], ey[~found] = 0, 0
+            motion[:, 0] += ex
+            motion[:, 1] += ey
+            if np.all(ex * ex + ey * ey < EPSILON ** 2):
+                break
+        guess = guess + motion
+        if level > 0:
+            guess *= 2
+    guess[~found] = np.nan
+    return guess[:, 0], guess[:, 1], found
+
+
+def check(image, shifts=((0.5, -0.25), (3.0, -2.0), (7.0, 5.0), (12.0, -9.0)), count=100):
+    """
+    Track points of image into copies of it shifted by (dx, dy): single
+    level Lucas-Kanade (21 x 21 window, as Optical_Flow) against the
+    pyramid (9 x 9 windows).
+    """
+    from scipy import ndimage
+    image = np.asarray(image, dtype=np.float64)
+    points = tracker.good_features(image, count, minDistance=8)
+    rows, cols = image.shape
+    points = points[(points[:, 0] > 40) & (points[:, 0] < cols - 40) & (points[:, 1] > 40) & (points[:, 1] < rows - 40)]
+    for sx, sy in shifts:
+        shifted = ndimage.shift(image, (sy, sx), order=3, mode='nearest')
+        for name, kwargs in (('single level, 21x21', dict(window_size=21, levels=1, iterations=1)),
+                             ('single level, 21x21, 5 iterations', dict(window_size=21, levels=1)),
+                             ('pyramid, 9x9', dict())):
+            start = time.time()
+            dx, dy, found = pyramid_flow(image, shifted, points, minEigenvalue=0, **kwargs)
+            err = np.sqrt((dx - sx) ** 2 + (dy - sy) ** 2)[found]
+            print("shift (%5.2f, %5.2f) %-34s median error %6.3f px, %3d of %d points within 0.5 px, %.1f ms" % (
+                sx, sy, name, np.median(err), np.count_nonzero(err < 0.5), len(points), 1000 * (time.time() - start)))
+
+
+if __name__ == '__main__':
+    from PIL import Image
+    check(Image.open('frame07.png'))
@@ -0,0 +1,208 @@
+"""
+Multi-point KLT tracking through a frame sequence.
+
+A Tracker follows many (x, y) points at once. For every frame pair it
+gathers the windows of all active points with one fancy index into the
+derivative images, forms their structure tensors and solves all the 2 x 2
+systems together (lucaskanade.solve_flow). The result is the same as
+calling Optical_Flow for each point in turn.
+
+The derivatives of a pair only depend on per-frame images: Ix and Iy come
+from the smoothed first frame and It is the difference of the box-filtered
+frames. FrameDerivatives caches these per frame, so frame i is filtered
+once and then reused as the previous frame of pair i -> i+1.
+
+A point is dropped when the smaller eigenvalue of its structure tensor,
+per window pixel, is below minEigenvalue (the flow is not determined
+there), or when its window leaves the image.
+"""
+import time
+from collections import OrderedDict
+import numpy as np
+from scipy import ndimage
+import convolve
+import lucaskanade
+from filters import boxfilter, gaussconvolve2d
+
+# defaults for Tracker
+MIN_EIGENVALUE = 1.0
+FRAME_CACHE_SIZE = 2
+
+
+class FrameDerivatives(object):
+    """
+    Per-frame parts of Estimate_Derivatives, (Ix, Iy, boxed): the
+    gradient of the Gaussian smoothed frame and the box-filtered frame,
+    cached for the last maxsize frames by key. An entry is only reused for
+    the same image array it was computed from (or when get is given no
+    image), so a key reused for another frame is recomputed, not stale.
+    """
+
+    def __init__(self, sigma=1.5, n=3, maxsize=FRAME_CACHE_SIZE):
+        self.sigma = sigma
+        self.n = n
+        self.maxsize = maxsize
+        self._frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        return key in self._frames
+
+    def get(self, key, image):
+        cached = self._frames.pop(key, None)
+        if cached is not None and (image is None or cached[0] is image):
+            self.hits += 1
+            image, entry = cached
+        else:
+            self.misses += 1
+            # as in OpticalFlow.Estimate_Derivatives
+            Ix, Iy = np.gradient(gaussconvolve2d(image, self.sigma))
+            boxed = convolve.convolve2d(image, boxfilter(self.n))
+            entry = (Ix, Iy, boxed)
+        self._frames[key] = (image, entry)
+        while len(self._frames) > self.maxsize:
+            self._frames.popitem(last=False)
+        return entry
+
+    def pair(self, key1, im1, key2, im2):
+        # (Ix, Iy, It) of the frame pair, as from Estimate_Derivatives
+        Ix, Iy, boxed1 = self.get(key1, im1)
+        boxed2 = self.get(key2, im2)[2]
+        return Ix, Iy, boxed2 - boxed1
+
+
+class Tracker(object):
+    """
+    Track points (N x 2 array of (x, y)) with Lucas-Kanade windows of
+    window_size, as Optical_Flow does for one point.
+
+    After every step, points holds the current positions, active which
+    points are still tracked, and history the positions after every frame
+    (NaN once a point is dropped).
+    """
+
+    def __init__(self, points, window_size=21, sigma=1.5, n=3, minEigenvalue=MIN_EIGENVALUE, cache=None):
+        assert((window_size % 2) == 1) , "Window size must be odd"
+        self.points = np.array(points, dtype=np.float64).reshape(-1, 2)
+        self.active = np.ones(len(self.points), dtype=bool)
+        self.window_size = window_size
+        self.minEigenvalue = minEigenvalue
+        self.cache = cache if cache is not None else FrameDerivatives(sigma, n)
+        self.history = [self.points.copy()]
+
+    def windows(self, images, points):
+        """
+        The window_size x window_size windows of the images around every
+        point, as N x window_size x window_size arrays, selected as in
+        Optical_Flow (rows int(y-half-1) onwards). Also returns which points
+        have their whole window inside the image.
+        """
+        half = self.window_size // 2
+        rows, cols = images[0].shape
+        top = points[:, 1] - half - 1
+        left = points[:, 0] - half - 1
+        r0 = top.astype(int)
+        c0 = left.astype(int)
+        # a window starting just above or left of the image would be cut
+        # short, as int() rounds towards zero
+        inside = (top >= 0) & (left >= 0) & (r0 + self.window_size <= rows) & (c0 + self.window_size <= cols)
+        d = np.arange(self.window_size)
+        r = np.clip(r0, 0, rows - self.window_size)[:, np.newaxis, np.newaxis] + d[:, np.newaxis]
+        c = np.clip(c0, 0, cols - self.window_size)[:, np.newaxis, np.newaxis] + d
+        return [image[r, c] for image in images], inside
+
+    def flow(self, derivatives, points):
+        """
+        Flow (dx, dy) of every point for one frame pair's (Ix, Iy, It), and
+        whether it is well determined (window inside the image, smaller
+        structure tensor eigenvalue per pixel at least minEigenvalue).
+        """
+        (Ix, Iy, It), inside = self.windows(derivatives, points)
+        Sxx = np.sum(Ix * Ix, axis=(1, 2))
+        Sxy = np.sum(Ix * Iy, axis=(1, 2))
+        Syy = np.sum(Iy * Iy, axis=(1, 2))
+        V0, V1 = lucaskanade.solve_flow(Sxx, Sxy, Syy, np.sum(Ix * It, axis=(1, 2)), np.sum(Iy * It, axis=(1, 2)))
+        # the tensor is positive semi-definite, a negative eigenvalue is
+        # round-off (of a flat window), which minEigenvalue=0 must keep
+        e = np.maximum(lucaskanade.min_eigenvalue(Sxx, Sxy, Syy), 0)
+        good = inside & (e >= self.minEigenvalue * self.window_size ** 2)
+        return V1, V0, good
+
+    def step(self, key1, im1, key2, im2):
+        """
+        Move the active points from frame im1 to im2 (keys identify the
+        frames in the derivative cache). Returns the flow of every point,
+        NaN for dropped ones.
+        """
+        derivatives = self.cache.pair(key1, im1, key2, im2)
+        dx = np.full(len(self.points), np.nan)
+        dy = np.full(len(self.points), np.nan)
+        idx = np.nonzero(self.active)[0]
+        if len(idx):
+            u, v, good = self.flow(derivatives, self.points[idx])
+            self.active[idx[~good]] = False
+            dx[idx[good]], dy[idx[good]] = u[good], v[good]
+        self.points[self.active] += np.column_stack((dx, dy))[self.active]
+        self.points[~self.active] = np.nan
+        self.history.append(self.points.copy())
+        return dx, dy
+
+    def track(self, frames):
+        """
+        Track through an iterable of frames (the first being the frame the
+        points are in). Returns the history as a frames x N x 2 array.
+        """
+        prev = None
+        for k, frame in enumerate(frames):
+            frame = np.asarray(frame)
+            if prev is not None:
+                self.step(k - 1, prev, k, frame)
+            prev = frame
+        return np.array(self.history)
+
+
+def good_features(image, count, window_size=21, sigma=1.5, minDistance=10):
+    """
+    Up to count (x, y) points with the largest smaller structure tensor
+    eigenvalue (Shi and Tomasi), at least minDistance apart, to track.
+    """
+    Ix, Iy = np.gradient(gaussconvolve2d(np.asarray(image), sigma))
+    e = lucaskanade.min_eigenvalue(lucaskanade.window_sum(Ix * Ix, window_size),
+                                   lucaskanade.window_sum(Ix * Iy, window_size),
+                                   lucaskanade.window_sum(Iy * Iy, window_size))
+    half = window_size // 2 + 1
+    e[:half, :] = e[-half:, :] = e[:, :half] = e[:, -half:] = 0
+    # local maxima, strongest first, greedily skipping points too close to
+    # a kept one
+    peaks = (e == ndimage.maximum_filter(e, 2 * minDistance + 1)) & (e > 0)
+    ys, xs = np.nonzero(peaks)
+    order = np.argsort(e[ys, xs])[::-1]
+    taken = np.zeros(e.shape, dtype=bool)
+    points = []
+    for y, x in zip(ys[order], xs[order]):
+        if len(points) == count:
+            break
+        if taken[y, x]:
+            continue
+        points.append((x + 1, y + 1)) # Optical_Flow windows are centred on (x-1, y-1)
+        taken[max(0, y - minDistance):y + minDistance + 1, max(0, x - minDistance):x + minDistance + 1] = True
+    return np.array(points, dtype=np.float64).reshape(-1, 2)
+
+
+def benchmark(frames, counts=(1, 100, 1000)):
+    for count in counts:
+        points = good_features(frames[0], count, minDistance=4)
+        start = time.time()
+        tracker = Tracker(points)
+        history = tracker.track(frames)
+        # frames each point was tracked through, after the one it started in
+        lengths = np.sum(~np.isnan(history[1:, :, 0]), axis=0)
+        print("%4d points through %d frames: %.1f ms, %d still tracked, mean track length %.1f frames, "
+              "%d frames filtered" % (len(points), len(frames), 1000 * (time.time() - start),
+                                      np.count_nonzero(tracker.active), np.mean(lengths), tracker.cache.misses))
+
+
+if __name__ == '__main__':
+    from PIL import Image
+    benchmark([np.asarray(Image.open('frame%02d.png' % i)) for i in range(7, 15)])
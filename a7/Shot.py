@@ -1,8 +1,10 @@
-from PIL import Image, ImageDraw
+from PIL import ImageDraw
 import numpy as np
 from scipy.cluster.vq import vq, kmeans
 from scipy.spatial.distance import cdist
 import matplotlib.pyplot as plt
+import framesource
+import histograms
 
 # Computes the cost of given boundaries. Good boundaries have zero cost.
 def get_boundaries_cost( boundaries, good_boundaries ):
@@ -25,36 +27,20 @@ def cluster2boundaries(histograms, centres):
 
 # Computes histograms from gray images
 def compute_gray_histograms( grays, nbins ):
+    fine = histograms.fine_histograms(grays)
     gray_hs = np.zeros(( nframes, nbins ), dtype = np.uint16 );
-
-    for i in range( len(grays) ):
-        gray_im = grays[i]
-        v1 = np.histogram(gray_im.flatten(),bins=nbins, range=(0,255))
-        gray_hs[i] = v1[0]
+    gray_hs[:len(fine)] = histograms.gray_histograms(fine, nbins)
 
     return gray_hs;
 
 
+# Computes the red, green and blue histograms of colour images side by side
 def compute_color_histograms( colors, nbins ):
-    red_hs = np.zeros(( nframes, nbins ), dtype = np.uint16 ); # red histgrams
-    green_hs = np.zeros(( nframes, nbins ), dtype = np.uint16 ); # green histograms
-    blue_hs = np.zeros(( nframes, nbins ), dtype = np.uint16 ); # blue histograms
-
-    for i in range( len(colors) ):
-        red_im = colors[i,:,:,0] # save red image
-        r1 = np.histogram(red_im.flatten(),bins=nbins, range=(0,255)) # flatten and histogram red
-
-        green_im = colors[i,:,:,1] # save green image
-        g1 = np.histogram(green_im.flatten(),bins=nbins, range=(0,255)) # flatten and histogram green
-
-        blue_im = colors[i,:,:,2] # save blue image
-        b1 = np.histogram(blue_im.flatten(),bins=nbins, range=(0,255)) # flatten and histogram blue
+    fine = histograms.fine_histograms(colors, channels=True)
+    color_hs = np.zeros(( nframes, 3*nbins ), dtype = np.uint16 );
+    color_hs[:len(fine)] = histograms.color_histograms(fine, nbins)
 
-        red_hs[i] = r1[0]
-        green_hs[i] = g1[0]
-        blue_hs[i] = b1[0]
-
-    return np.hstack((red_hs,green_hs,blue_hs)) # stack the histograms together
+    return color_hs # red, green and blue histograms stacked together
 
 # for debugging
 np.set_printoptions(threshold=np.nan)
@@ -72,16 +58,34 @@ good_boundaries = [33,92,143]
 gb_bool = np.zeros( nframes+1, dtype = np.bool )
 gb_bool[ good_boundaries ] = True
 
-# Create some space to load the images into memory
-colors = np.zeros(( nframes, im_height, im_width, 3), dtype = np.uint8);
-grays  = np.zeros(( nframes, im_height, im_width   ), dtype = np.uint8);
+# Frame differences (see below) are computed while the frames stream in,
+# from a ring buffer holding only the current and previous gray frame
+recent    = framesource.RingBuffer( 2, ( im_height, im_width ) )
+fdiffs    = np.zeros( nframes )
+sqdiffs   = np.zeros( nframes )
+avgdiffs  = np.zeros( nframes )
+histdiffs = np.zeros( nframes )
 
-# Read the images and store them in color and grayscale formats
-for i in range( nframes ):
-    imname    = '%s/dwc%03d.png' % ( fname, i+1 )
-    im        = Image.open( imname ).convert( 'RGB' )
-    colors[i] = np.asarray(im, dtype = np.uint8)
-    grays[i]  = np.asarray(im.convert( 'L' ))
+# Every frame is also histogrammed once, into 256 bins per channel, while
+# it streams in; every bin count below is rebinned from those
+gray_fine  = np.zeros(( nframes, histograms.FINE_BINS ), dtype = np.int64 )
+color_fine = np.zeros(( nframes, 3, histograms.FINE_BINS ), dtype = np.int64 )
+
+# Read the images in color and grayscale formats (decoded on a background
+# thread while the previous frames are processed). Only the per-frame
+# results are kept, so memory does not grow with the number of frames
+paths = framesource.frame_paths( fname + '/dwc%03d.png', 1, nframes+1 )
+for i, (color, gray) in framesource.FrameSource( paths, ('RGB', 'L') ):
+    recent.push( gray )
+    gray_fine[i]  = histograms.fine_histograms(gray[np.newaxis])
+    color_fine[i] = histograms.fine_histograms(color[np.newaxis], channels=True)
+    curr_hist = compute_gray_histograms(gray, 10) # compute current gray histogram
+    if i > 0: # skip first to avoid indexing issue
+        fdiffs[i] = np.sum(abs(recent[0]-recent[1])) # calculate the sum of abs difference between successive frames
+        sqdiffs[i] = (np.sum(abs(recent[0]-recent[1]))**2) # calculate the squared sum of abs difference between successive frames
+        avgdiffs[i] = np.mean(recent[0])-np.mean(recent[1]) # calculate the mean of current and previous frames and take the difference
+        histdiffs[i] = np.linalg.norm(curr_hist-prev_hist) # find euclidean distance (l2-norm)
+    prev_hist = curr_hist # save previous histogram as current
 
 # Initialize color histogram
 nclusters   = 4;
@@ -91,7 +95,7 @@ color_costs = np.zeros( len(nbins) );
 
 # === GRAY HISTOGRAMS ===
 for n in nbins:
-    gray_histogram = compute_gray_histograms(grays, n).astype(float) # generate the gray histogram
+    gray_histogram = histograms.gray_histograms(gray_fine, n).astype(float) # generate the gray histogram
     codebook, distortion = kmeans(gray_histogram, nclusters) # use pythons kmeans to get clusters
     boundaries = cluster2boundaries(gray_histogram, codebook.astype(float)) # compute the boundaries
     gray_costs[n-2] = get_boundaries_cost(boundaries, gb_bool) #save cost for given bin size
@@ -108,7 +112,7 @@ plt.show()
 
 # === COLOR HISTOGRAMS ===
 for n in nbins:
-    color_histogram = compute_color_histograms(colors, n).astype(float) # generate the color histogram
+    color_histogram = histograms.color_histograms(color_fine, n).astype(float) # generate the color histogram
     codebook, distortion = kmeans(color_histogram, nclusters) # use pythons kmeans to get clusters
     boundaries = cluster2boundaries(color_histogram, codebook.astype(float)) # compute the boundaries
     color_costs[n-2] = get_boundaries_cost(boundaries, gb_bool) #save cost for given bin size
@@ -123,12 +127,8 @@ plt.axis([2, 13, -1, 10])
 plt.grid(True)
 plt.show()
 
-fdiffs = np.zeros( nframes )
 # === ABSOLUTE FRAME DIFFERENCES ===
-for i in range( nframes ):
-    if i==0: # skip first to avoid indexing issue
-        continue
-    fdiffs[i] = np.sum(abs(grays[i]-grays[i-1])) # calculate the sum of abs difference between successive frames
+# (fdiffs is computed while reading the frames)
 
 plt.figure(4)
 plt.xlabel('Frame number')
@@ -137,12 +137,8 @@ plt.title('Absolute frame differences')
 plt.plot(fdiffs)
 plt.show()
 
-sqdiffs = np.zeros( nframes )
 # === SQUARED FRAME DIFFERENCES ===
-for i in range( nframes ):
-    if i==0: # skip first to avoid indexing issue
-        continue
-    sqdiffs[i] = (np.sum(abs(grays[i]-grays[i-1]))**2) # calculate the squared sum of abs difference between successive frames
+# (sqdiffs is computed while reading the frames)
 
 plt.figure(5)
 plt.xlabel('Frame number')
@@ -151,12 +147,8 @@ plt.title('Squared frame differences')
 plt.plot(sqdiffs)
 plt.show()
 
-avgdiffs = np.zeros( nframes )
 # === AVERAGE GRAY DIFFERENCES ===
-for i in range( nframes ):
-    if i==0: # skip first to avoid indexing issue
-        continue
-    avgdiffs[i] = np.mean(grays[i])-np.mean(grays[i-1]) # calculate the mean of current and previous frames and take the difference
+# (avgdiffs is computed while reading the frames)
 
 plt.figure(6)
 plt.xlabel('Frame number')
@@ -165,15 +157,8 @@ plt.title('Average gray frame differences')
 plt.plot(avgdiffs)
 plt.show()
 
-histdiffs = np.zeros( nframes )
-prev_hist = compute_gray_histograms(grays[0], 10) # compute initial gray histogram
 # === HISTOGRAM DIFFERENCES ===
-for i in range( nframes ):
-    if i==0: # skip first to avoid indexing issue
-        continue
-    curr_hist = compute_gray_histograms(grays[i], 10) # compute current gray histogram
-    histdiffs[i] = np.linalg.norm(curr_hist-prev_hist) # find euclidean distance (l2-norm)
-    prev_hist = curr_hist # save previous histogram as current 
+# (histdiffs is computed while reading the frames)
 
 plt.figure(7)
 plt.xlabel('Frame number')